@@ -1,26 +1,208 @@
 print("🚀 Starting CLIP API...")
 
+import os
+import time
+import asyncio
+import resource
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+
 from fastapi import FastAPI, Request
-from transformers import CLIPTokenizer, CLIPModel
-import torch
 
-print("📦 Loading tokenizer and model...")
+from embedding_cache import CLIP_MODEL, open_embedding_cache
+from clip_backends import CLIP_BACKEND, CLIP_THREADS, load_encoder
+
+# --- Micro-batching config ---
+MAX_BATCH_SIZE = int(os.getenv("CLIP_MAX_BATCH_SIZE", "64"))
+BATCH_WAIT_MS = float(os.getenv("CLIP_BATCH_WAIT_MS", "5"))
+# Batches encoded at once. The default single thread lets torch/ONNX Runtime
+# parallelise one forward pass across cores; with more workers, set
+# CLIP_THREADS to about cores / CLIP_WORKERS.
+CLIP_WORKERS = int(os.getenv("CLIP_WORKERS", "1"))
+
+
+def rss_mb():
+    """Current resident memory of this process in MiB."""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+print(f"📦 Loading {CLIP_MODEL} text encoder ({CLIP_BACKEND})...")
 
 try:
-    tokenizer = CLIPTokenizer.from_pretrained("openai/clip-vit-base-patch32")
-    model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-    print("✅ Model loaded successfully.")
+    rss_before_load = rss_mb()
+    load_started = time.perf_counter()
+    encoder = load_encoder(CLIP_MODEL, CLIP_BACKEND)
+    LOAD_STATS = {
+        "load_seconds": round(time.perf_counter() - load_started, 3),
+        "model_rss_mb": round(rss_mb() - rss_before_load, 1),
+    }
+    print(f"✅ Model loaded successfully in {LOAD_STATS['load_seconds']}s.")
 except Exception as e:
     print("❌ Error loading CLIP model:", e)
     raise
 
-app = FastAPI()
+executor = ThreadPoolExecutor(max_workers=CLIP_WORKERS, thread_name_prefix="clip")
+
+# Persistent embedding cache shared with the pipeline (EMBEDDING_CACHE_PATH)
+embedding_cache = open_embedding_cache()
+
+
+def run_model(texts):
+    """Run one padded forward pass over `texts` and return their embeddings."""
+    return encoder.encode(texts)
+
+
+def encode_texts(texts):
+    """Embed `texts`, running the model only for those missing from the cache."""
+    if embedding_cache is None:
+        return run_model(texts)
+
+    cached = embedding_cache.get_many(texts)
+    missing = list(dict.fromkeys(text for text in texts if text not in cached))
+    if missing:
+        computed = run_model(missing)
+        embedding_cache.put_many(zip(missing, computed))
+        cached.update(zip(missing, computed))
+    return [cached[text] for text in texts]
+
+
+class MicroBatcher:
+    """
+    Collects concurrent single-text requests for up to `max_wait_ms` and
+    encodes them together in one forward pass on the inference thread.
+    """
+
+    def __init__(self, encode, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=BATCH_WAIT_MS, workers=CLIP_WORKERS):
+        self.encode = encode
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.workers = workers
+        self.queue = None
+        self.worker = None
+        self.slots = None
+        self.tasks = set()
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        # Up to `workers` batches run at once, one per inference thread
+        self.slots = asyncio.Semaphore(self.workers)
+        self.worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self.worker.cancel()
+        try:
+            await self.worker
+        except asyncio.CancelledError:
+            pass
+
+    async def embed(self, text):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((text, future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _encode(self, batch):
+        texts = [text for text, _ in batch]
+        try:
+            embeddings = await asyncio.get_running_loop().run_in_executor(executor, self.encode, texts)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.slots.release()
+        for (_, future), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+
+    async def _run(self):
+        while True:
+            await self.slots.acquire()
+            batch = await self._collect()
+            task = asyncio.create_task(self._encode(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+
+batcher = MicroBatcher(encode_texts)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    batcher.start()
+    yield
+    await batcher.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "model": CLIP_MODEL, "backend": CLIP_BACKEND}
+
+def benchmark(texts=256, batch_size=32):
+    """Time the encoder alone (no cache): single-text latency and batched throughput."""
+    samples = [f"benchmark sentence {i}: a city in county {i % 97} with {i * 7} residents" for i in range(texts)]
+    latencies = []
+    for text in samples[:32]:
+        started = time.perf_counter()
+        run_model([text])
+        latencies.append((time.perf_counter() - started) * 1000)
+    started = time.perf_counter()
+    for start in range(0, texts, batch_size):
+        run_model(samples[start:start + batch_size])
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "model": CLIP_MODEL,
+        "backend": CLIP_BACKEND,
+        "threads": CLIP_THREADS,
+        "workers": CLIP_WORKERS,
+        **LOAD_STATS,
+        "rss_mb": round(rss_mb(), 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "single_text_ms_p50": round(latencies[len(latencies) // 2], 2),
+        "batch_size": batch_size,
+        "texts": texts,
+        "texts_per_second": round(texts / elapsed, 1),
+    }
+
+@app.get("/benchmark")
+async def run_benchmark(texts: int = 256, batch_size: int = 32):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, benchmark, max(1, texts), max(1, batch_size))
 
 @app.post("/embed")
 async def embed_text(request: Request):
     body = await request.json()
     text = body.get("text", "")
-    inputs = tokenizer(text, return_tensors="pt", padding=True, truncation=True)
-    with torch.no_grad():
-        embeddings = model.get_text_features(**inputs)
-    return {"embedding": embeddings[0].tolist()}
+    return {"embedding": await batcher.embed(text)}
+
+@app.post("/embed/batch")
+async def embed_batch(request: Request):
+    body = await request.json()
+    texts = body.get("texts", [])
+    loop = asyncio.get_running_loop()
+    embeddings = []
+    for start in range(0, len(texts), MAX_BATCH_SIZE):
+        chunk = texts[start:start + MAX_BATCH_SIZE]
+        embeddings.extend(await loop.run_in_executor(executor, encode_texts, chunk))
+    return {"embeddings": embeddings}
@@ -0,0 +1,98 @@
+"""
+CLIP text encoders for the API.
+
+Only the text tower is loaded (CLIPTextModelWithProjection); its
+`text_embeds` are exactly CLIPModel.get_text_features, without keeping the
+vision tower in memory. CLIP_BACKEND selects how it runs:
+
+- torch: fp32 PyTorch (default)
+- int8:  PyTorch with dynamically quantized int8 Linear layers
+- onnx:  ONNX Runtime; the text model is exported once to CLIP_ONNX_DIR
+
+CLIP_THREADS sets the intra-op threads of each inference call (0 keeps the
+library default).
+"""
+import os
+
+from transformers import CLIPTokenizer, CLIPTextModelWithProjection
+import torch
+
+CLIP_BACKEND = os.getenv("CLIP_BACKEND", "torch")
+CLIP_THREADS = int(os.getenv("CLIP_THREADS", "0"))
+CLIP_ONNX_DIR = os.getenv("CLIP_ONNX_DIR", "onnx")
+
+BACKENDS = ("torch", "int8", "onnx")
+
+
+class TorchTextEncoder:
+    def __init__(self, model_name, quantize=False, threads=CLIP_THREADS):
+        if threads:
+            torch.set_num_threads(threads)
+        self.tokenizer = CLIPTokenizer.from_pretrained(model_name)
+        model = CLIPTextModelWithProjection.from_pretrained(model_name).eval()
+        if quantize:
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model = model
+
+    def encode(self, texts):
+        inputs = self.tokenizer(texts, return_tensors="pt", padding=True, truncation=True)
+        with torch.inference_mode():
+            embeddings = self.model(**inputs).text_embeds
+        return embeddings.tolist()
+
+
+class _TextEmbeds(torch.nn.Module):
+    """Export wrapper returning only the projected text embeddings."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask).text_embeds
+
+
+def export_onnx(model_name, path):
+    model = CLIPTextModelWithProjection.from_pretrained(model_name).eval()
+    dummy = torch.ones((1, 8), dtype=torch.long)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    torch.onnx.export(
+        _TextEmbeds(model), (dummy, dummy), tmp_path,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["text_embeds"],
+        dynamic_axes={"input_ids": {0: "batch", 1: "sequence"},
+                      "attention_mask": {0: "batch", 1: "sequence"},
+                      "text_embeds": {0: "batch"}},
+        opset_version=17,
+    )
+    os.replace(tmp_path, path)
+
+
+class OnnxTextEncoder:
+    def __init__(self, model_name, threads=CLIP_THREADS, onnx_dir=CLIP_ONNX_DIR):
+        import onnxruntime
+
+        path = os.path.join(onnx_dir, model_name.replace("/", "__") + ".onnx")
+        if not os.path.exists(path):
+            print(f"📦 Exporting {model_name} text model to {path}...")
+            export_onnx(model_name, path)
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.tokenizer = CLIPTokenizer.from_pretrained(model_name)
+
+    def encode(self, texts):
+        inputs = self.tokenizer(texts, return_tensors="np", padding=True, truncation=True)
+        feeds = {"input_ids": inputs["input_ids"].astype("int64"),
+                 "attention_mask": inputs["attention_mask"].astype("int64")}
+        return self.session.run(["text_embeds"], feeds)[0].tolist()
+
+
+def load_encoder(model_name, backend=CLIP_BACKEND):
+    if backend not in BACKENDS:
+        raise ValueError(f"CLIP_BACKEND must be one of {BACKENDS}, got {backend!r}")
+    if backend == "onnx":
+        return OnnxTextEncoder(model_name)
+    return TorchTextEncoder(model_name, quantize=backend == "int8")
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+asyncio variant of the pipeline.
+
+Every item runs as a task on one event loop instead of on pool threads.
+Within an item the gold query starts right away, next to the mapping fetch
+and the LLM generation that follows it; embedding, injection and execution
+run once the DSL is there. Across items all stages overlap, bounded by one
+semaphore per backend:
+
+- LLM:  LLM_CONCURRENCY    (openai's acreate over a pooled aiohttp session)
+- CLIP: CLIP_CONCURRENCY   (aiohttp, with the retries and breaker of http_clients)
+- ES:   ES_CONCURRENCY     (AsyncElasticsearch; generated queries)
+- gold: GOLD_CONCURRENCY   (AsyncElasticsearch; ground truth queries)
+
+Stage outputs, scores, traces, the gold store and the run store are the same
+as with the threaded EvaluationScheduler. Mappings come from the same bulk
+loaded MappingCache. Its refreshes and the SQLite reads and writes of the
+caches and stores run on worker threads (asyncio.to_thread), off the loop.
+Generated queries are not grouped into _msearch (ES_BATCH_SIZE); concurrent
+searches share the client's connection pool instead.
+
+    python async_pipeline.py [group ...]
+    python full_pipeline_runner.py --async [group ...]
+"""
+import os
+import sys
+import json
+import asyncio
+from contextlib import nullcontext
+
+import aiohttp
+import openai
+from elasticsearch import AsyncElasticsearch
+
+from http_clients import (
+    ES_HOST, CLIP_HOST, ES_TIMEOUT, CLIP_TIMEOUT, LLM_TIMEOUT, HTTP_CONNECT_TIMEOUT, HTTP_RETRIES,
+    HTTP_POOL_SIZE, RETRY_STATUSES, CircuitBreaker, aretry, get_es_client,
+)
+from vector_serializer import SERIALIZERS
+from export_index_mapping import wait_for_elasticsearch
+from index_layout import TableLayout
+from mapping_cache import MappingCache
+from gold_store import open_gold_store
+from tracing import Tracer, trace_span, output_size
+from generate_query_from_nlq import aget_response
+from generate_embedding import embedding_cache, embedding_text
+from inject_embedding_into_query import parse_query
+from execute_query import RESULT_FILTER_PATH, asearch_results, error_text, extract_results, format_results, \
+    prepare_search
+from knn_planner import plan_query
+from run_correct_query import MASTER_CSV, convert_to_elasticsearch_dsl
+from pipeline_engine import PipelineStageError, store_output
+from evaluation_scheduler import (
+    EvaluationScheduler, GROUPS, LLM_CONCURRENCY, ES_CONCURRENCY, GOLD_CONCURRENCY, LLM_STAGES, EXEC_STAGES,
+    GOLD_STAGES, load_group,
+)
+from run_store import RUN_STORE_PATH, open_run_store
+
+CLIP_CONCURRENCY = int(os.getenv("CLIP_CONCURRENCY", "8"))
+
+
+class RetryableStatus(Exception):
+    pass
+
+
+class AsyncClipClient:
+    """POST /embed over aiohttp with the timeouts, retries and circuit breaker of http_clients."""
+
+    def __init__(self, session, base_url=CLIP_HOST):
+        self.session = session
+        self.base_url = base_url.rstrip("/")
+        self.breaker = CircuitBreaker("CLIP API")
+
+    async def _post(self, path, body):
+        async with self.session.post(f"{self.base_url}{path}", json=body) as response:
+            if response.status in RETRY_STATUSES:
+                raise RetryableStatus(f"{response.status} from {path}")
+            response.raise_for_status()
+            return await response.json()
+
+    async def post(self, path, body):
+        retryable = (aiohttp.ClientConnectionError, asyncio.TimeoutError, RetryableStatus)
+        return await self.breaker.acall(aretry, lambda: self._post(path, body), retryable)
+
+    async def embed(self, text):
+        if embedding_cache is not None:
+            cached = await asyncio.to_thread(embedding_cache.get, text)
+            if cached is not None:
+                return cached
+        embedding = (await self.post("/embed", {"text": text}))["embedding"]
+        if embedding_cache is not None:
+            await asyncio.to_thread(embedding_cache.put, text, embedding)
+        return embedding
+
+
+def _session(limit, read_timeout):
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=limit),
+        timeout=aiohttp.ClientTimeout(sock_connect=HTTP_CONNECT_TIMEOUT, sock_read=read_timeout),
+    )
+
+
+class AsyncPipelineEngine:
+    """PipelineEngine with coroutine stages. Use as `async with engine:` inside the event loop."""
+
+    def __init__(self, gold_store=True, tracer=None, llm_workers=LLM_CONCURRENCY, clip_workers=CLIP_CONCURRENCY,
+                 es_workers=ES_CONCURRENCY, gold_workers=GOLD_CONCURRENCY):
+        self.tracer = tracer if tracer is not None else Tracer.from_env()
+        self.use_gold_store = gold_store
+        self.llm_workers = llm_workers
+        self.clip_workers = clip_workers
+        self.es_workers = es_workers
+        self.gold_workers = gold_workers
+
+    async def __aenter__(self):
+        with trace_span(self.tracer, None, "startup"):
+            await asyncio.to_thread(wait_for_elasticsearch)
+            # The layout registry and the gold store's index versions are read
+            # once at startup with the shared sync client, off the event loop
+            self.layout = TableLayout(get_es_client())
+            self.mappings = MappingCache(get_es_client(), layout=self.layout)
+            self.gold_store = open_gold_store(get_es_client(), self.layout) if self.use_gold_store else None
+            await asyncio.to_thread(self.layout.preload)
+            if not self.layout.shared:
+                # Shared-layout mappings are projected from the layout registry
+                await asyncio.to_thread(self.mappings.preload)
+            if self.gold_store is not None:
+                await asyncio.to_thread(self.gold_store.refresh_versions)
+
+        # Backend slot a stage holds while it runs
+        self.semaphores = {
+            "generate": asyncio.Semaphore(self.llm_workers),
+            "embed": asyncio.Semaphore(self.clip_workers),
+            "execute": asyncio.Semaphore(self.es_workers),
+            "gold": asyncio.Semaphore(self.gold_workers),
+        }
+        self.es = AsyncElasticsearch(
+            ES_HOST,
+            serializers=SERIALIZERS,
+            request_timeout=ES_TIMEOUT,
+            max_retries=HTTP_RETRIES,
+            retry_on_timeout=True,
+            retry_on_status=RETRY_STATUSES,
+            connections_per_node=max(HTTP_POOL_SIZE, self.es_workers + self.gold_workers),
+        )
+        self.llm_session = _session(self.llm_workers, LLM_TIMEOUT)
+        self.clip = AsyncClipClient(_session(self.clip_workers, CLIP_TIMEOUT))
+        # Seen by the acreate calls of every task started from here
+        openai.aiosession.set(self.llm_session)
+        return self
+
+    async def __aexit__(self, *exc):
+        openai.aiosession.set(None)
+        await self.llm_session.close()
+        await self.clip.session.close()
+        await self.es.close()
+
+    # --- Stages ---
+
+    async def mapping(self, item):
+        # Cache hits are in memory; the thread covers TTL re-checks and misses
+        return await asyncio.to_thread(self.mappings.render, item.index_name)
+
+    async def generate(self, item):
+        return await aget_response(item.outputs["mapping"].strip(), item.nlq)
+
+    async def embed(self, item):
+        text = embedding_text(item.outputs["generate"])
+        if text is None:
+            return None
+        return await self.clip.embed(text)
+
+    async def inject(self, item):
+        return parse_query(item.outputs["generate"], item.outputs["embed"])
+
+    async def execute(self, item):
+        query = item.outputs["inject"]
+        item.results["execute"] = None
+        if query.body is None:
+            return query.error
+        try:
+            physical_index, body, routing = self.layout.scope(item.index_name, plan_query(query.body))
+            results = await asearch_results(self.es, physical_index, body, routing)
+        except Exception as e:
+            return error_text(e)
+        item.results["execute"] = results
+        return format_results(results)
+
+    async def _correct_results(self, item):
+        result = convert_to_elasticsearch_dsl(item.encoded_query, MASTER_CSV)
+        if result is None:
+            return json.dumps(None)
+        _, index_name, query, _ = result
+        physical_index, query, routing = self.layout.scope(index_name, plan_query(query))
+        response = await self.es.search(index=physical_index, body=prepare_search(query), routing=routing,
+                                        filter_path=RESULT_FILTER_PATH)
+        return json.dumps(extract_results(response))
+
+    async def gold(self, item):
+        def run():
+            return self._correct_results(item)
+
+        stored = await run() if self.gold_store is None else await self.gold_store.alookup_or_run(item, run)
+        results = json.loads(stored)
+        item.results["gold"] = results
+        if results is None:
+            return "Table ID not found."
+        return format_results(results)
+
+    # --- Driving ---
+
+    async def run_stage(self, item, stage):
+        # Spans time the stage itself, not the wait for a backend slot
+        async with self.semaphores.get(stage, nullcontext()):
+            with trace_span(self.tracer, item, stage) as span:
+                try:
+                    output = await getattr(self, stage)(item)
+                except Exception as e:
+                    raise PipelineStageError(stage, e) from e
+                if span is not None:
+                    span["bytes"] = output_size(output)
+        store_output(item, stage, output)
+        return output
+
+
+class AsyncEvaluationScheduler(EvaluationScheduler):
+    """EvaluationScheduler running every item as a task on one event loop."""
+
+    async def _run_stages(self, item, stages):
+        for stage in stages:
+            # Outputs restored from the run store are not recomputed
+            if stage in item.outputs:
+                continue
+            await self.engine.run_stage(item, stage)
+            if self.store is not None:
+                await asyncio.to_thread(self.store.save_stage, item, stage)
+
+    async def _run_item(self, item, counts, totals):
+        # The gold query runs alongside mapping, generation and execution
+        outcomes = await asyncio.gather(
+            self._run_stages(item, GOLD_STAGES),
+            self._run_stages(item, LLM_STAGES + EXEC_STAGES),
+            return_exceptions=True,
+        )
+        for outcome in outcomes:
+            if isinstance(outcome, PipelineStageError):
+                await asyncio.to_thread(self._fail, item, outcome)
+                return
+            if isinstance(outcome, BaseException):
+                raise outcome
+        # Both write the run store
+        await asyncio.to_thread(self._record, item, counts, totals)
+
+    async def aevaluate(self, items):
+        counts = {item.group: 0 for item in items}
+        totals = dict(counts)
+        items = self._restore(items, counts, totals)
+        async with self.engine:
+            await asyncio.gather(*(self._run_item(item, counts, totals) for item in items))
+        return {group: (counts[group], totals[group]) for group in counts}
+
+    def evaluate(self, items):
+        """Run every item through all stages; returns {group: (correct, total)} over completed items."""
+        return asyncio.run(self.aevaluate(items))
+
+
+def main(groups=GROUPS, outputs_dir=None, run_store=RUN_STORE_PATH, fresh=False):
+    """Evaluate `groups` on one event loop; returns ({group: (correct, total)}, failures)."""
+    items = []
+    for group in groups:
+        items.extend(load_group(group, outputs_dir=outputs_dir))
+
+    store = open_run_store(run_store)
+    if store is not None and fresh:
+        store.clear()
+
+    engine = AsyncPipelineEngine()
+    scheduler = AsyncEvaluationScheduler(engine, store=store)
+    try:
+        results = scheduler.evaluate(items)
+    finally:
+        if engine.tracer is not None:
+            engine.tracer.close()
+
+    for group, (correct, total) in results.items():
+        print(f"{group}: {correct} / {total}")
+    if scheduler.failures:
+        print(f"⚠️ {len(scheduler.failures)} items failed", file=sys.stderr)
+    return results, scheduler.failures
+
+
+if __name__ == "__main__":
+    _, failures = main(sys.argv[1:] or GROUPS, outputs_dir=os.getenv("OUTPUTS_DIR"))
+    sys.exit(1 if failures else 0)
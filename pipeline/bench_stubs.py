@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+"""
+Deterministic local stand-ins for the services the pipeline calls.
+
+- LLM:  OpenAI-compatible /v1/chat/completions (plain and streamed). It finds
+        the NLQ in the prompt and answers with the gold DSL of that TEST_SET
+        item, written the way the model writes it: fenced JSON with a bare
+        $vector$ placeholder and the text to embed after "~".
+- CLIP: /embed and /embed/batch return unit vectors seeded by a hash of the
+        text, so the same text always gets the same vector.
+- ES:   the Elasticsearch endpoints the pipeline uses (_mapping, cluster
+        state, _cat/indices, _search, _msearch) over mappings built from
+        inputs/headers.csv and types.csv. Hits and aggregation values depend
+        only on the index and the selected fields.
+
+Each stand-in runs in its own process, so its CPU time and memory do not
+count towards the pipeline being measured. Every response can be delayed
+(--*-latency-ms) to model real service times.
+
+To serve them in the foreground, e.g. for full_pipeline_runner.py:
+
+    python bench_stubs.py [group ...]
+"""
+import re
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import string
+import hashlib
+import fnmatch
+import zlib
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from gold_compiler import get_compiler
+from table_metadata import get_store
+
+TEST_SET_DIR = "data/TEST_SET"
+PROMPT_TEMPLATE_PATH = "inputs/prompt.txt"
+VECTOR_DIMS = 512
+VECTOR_PLACEHOLDER = "$vector$"
+# Characters per streamed chunk; Ollama sends about one token per chunk
+CHARS_PER_TOKEN = 4
+
+
+def load_items(groups, limit=None, test_set_dir=TEST_SET_DIR):
+    """TEST_SET lines of `groups` as (group, data), the first `limit` of each group."""
+    items = []
+    for group in groups:
+        with open(f"{test_set_dir}/{group}_query.jsonl", 'r', encoding='utf-8') as infile:
+            lines = (line.strip() for line in infile)
+            group_items = [(group, json.loads(line)) for line in lines if line]
+        items.extend(group_items[:limit] if limit else group_items)
+    return items
+
+
+# --- Canned data ---
+
+def _placeholder_vectors(node):
+    if isinstance(node, dict):
+        if "knn" in node and "query_vector" in node["knn"]:
+            return {**node, "knn": {**node["knn"], "query_vector": VECTOR_PLACEHOLDER}}
+        return {key: _placeholder_vectors(value) for key, value in node.items()}
+    if isinstance(node, list):
+        return [_placeholder_vectors(value) for value in node]
+    return node
+
+
+def canned_response(encoded_query, compiler=None):
+    """The LLM response answering a TEST_SET item with its gold DSL, or None for an unknown table."""
+    result = (compiler or get_compiler()).compile(encoded_query)
+    if result is None:
+        return None
+    _, _, query, question = result
+    templated = _placeholder_vectors(query)
+    text = json.dumps(templated, indent=2, ensure_ascii=False).replace(json.dumps(VECTOR_PLACEHOLDER), VECTOR_PLACEHOLDER)
+    response = f"```json\n{text}\n```"
+    if templated != query:
+        response += f"\n~ {question}"
+    return response
+
+
+def canned_responses(items):
+    compiler = get_compiler()
+    responses = {}
+    for _, data in items:
+        response = canned_response(data, compiler)
+        if response is not None:
+            responses[data["question"]] = response
+    return responses
+
+
+def question_markers(template_path=PROMPT_TEMPLATE_PATH):
+    """The prompt text right before and right after {nl_query}."""
+    with open(template_path, 'r', encoding='utf-8') as f:
+        tail = f.read().split("{index_mapping}", 1)[1]
+    parts = list(string.Formatter().parse(tail))
+    for n, (literal, field, _, _) in enumerate(parts):
+        if field == "nl_query":
+            after = parts[n + 1][0] if n + 1 < len(parts) else ""
+            return literal, after
+    raise ValueError(f"No {{nl_query}} in {template_path}")
+
+
+def field_mapping(column_type):
+    """Field mapping as the uploader creates it for a column type."""
+    if column_type == "text":
+        return {"type": "text", "analyzer": "standard", "fields": {"keyword": {"type": "keyword"}}}
+    if column_type == "dense_vector":
+        return {"type": "dense_vector", "dims": VECTOR_DIMS, "index": True, "similarity": "cosine"}
+    return {"type": "double"}
+
+
+def stub_mappings(items):
+    """{index name: properties} of the tables the items query."""
+    store = get_store()
+    mappings = {}
+    for _, data in items:
+        table = store.get(data["table_id"])
+        if table is None or not table.headers or not table.types:
+            continue
+        index_name = f"table{data['table_id'].replace('-', '_')[1:]}"
+        mappings[index_name] = {
+            header.replace('No.', 'No'): field_mapping(column_type)
+            for header, column_type in zip(table.headers, table.types) if header
+        }
+    return mappings
+
+
+def hashed_vector(text, dims=VECTOR_DIMS):
+    """A unit vector seeded by the text's hash."""
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    vector = [rng.gauss(0.0, 1.0) for _ in range(dims)]
+    norm = math.sqrt(sum(x * x for x in vector))
+    return [x / norm for x in vector]
+
+
+# --- HTTP plumbing ---
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Keep-alive, like the real services, so client connection pools are exercised
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this Nagle adds ~40 ms
+    disable_nagle_algorithm = True
+    routes = ()
+    extra_headers = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def read_json(self):
+        body = self.read_body()
+        return json.loads(body) if body else {}
+
+    def send_json(self, status, body, content_type="application/json"):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in self.extra_headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(data)
+
+    def delay(self):
+        if self.server.latency_s:
+            time.sleep(self.server.latency_s)
+
+    def dispatch(self):
+        path = self.path.split("?", 1)[0]
+        for method, pattern, handler in self.routes:
+            match = re.fullmatch(pattern, path)
+            if match and self.command in method.split("|"):
+                try:
+                    return getattr(self, handler)(*match.groups())
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client stopped reading (e.g. an early-stopped stream)
+                    self.close_connection = True
+                    return
+        self.read_body()
+        self.send_json(404, {"error": {"type": "stub_unsupported", "reason": f"{self.command} {path}"}, "status": 404})
+
+    do_GET = do_POST = do_HEAD = do_DELETE = do_PUT = dispatch
+
+
+class LLMHandler(StubHandler):
+    routes = (("POST", r"(?:/v1)?/chat/completions", "completion"),)
+
+    def completion(self):
+        request = self.read_json()
+        prompt = request["messages"][-1]["content"]
+        before, after = self.server.markers
+        start = prompt.rfind(before)
+        question = prompt[start + len(before):len(prompt) - len(after)] if start >= 0 else ""
+        text = self.server.responses.get(question, "{}")
+        self.delay()
+        if request.get("stream"):
+            return self.stream(request, text)
+
+        tokens = -(-len(text) // CHARS_PER_TOKEN)
+        if self.server.token_s:
+            time.sleep(tokens * self.server.token_s)
+        self.send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": -(-len(prompt) // CHARS_PER_TOKEN), "completion_tokens": tokens},
+        })
+
+    def write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def stream(self, request, text):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        pieces = [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)]
+        for n, piece in enumerate(pieces + [None]):
+            if piece is not None and self.server.token_s:
+                time.sleep(self.server.token_s)
+            event = {
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model"),
+                "choices": [{"index": 0, "delta": {"content": piece} if piece is not None else {},
+                             "finish_reason": None if piece is not None else "stop"}],
+            }
+            self.write_chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+        self.write_chunk(b"data: [DONE]\n\n")
+        self.write_chunk(b"")
+
+
+class ClipHandler(StubHandler):
+    routes = (
+        ("GET", r"/health", "health"),
+        ("POST", r"/embed", "embed"),
+        ("POST", r"/embed/batch", "embed_batch"),
+    )
+
+    def health(self):
+        self.send_json(200, {"status": "ok", "backend": "stub"})
+
+    def embed(self):
+        text = self.read_json()["text"]
+        self.delay()
+        self.send_json(200, {"embedding": hashed_vector(text)})
+
+    def embed_batch(self):
+        texts = self.read_json()["texts"]
+        self.delay()
+        self.send_json(200, {"embeddings": [hashed_vector(text) for text in texts]})
+
+
+def stub_value(index_name, field, n=0):
+    return zlib.crc32(f"{index_name}/{field}/{n}".encode("utf-8")) % 100000 / 100
+
+
+class ESHandler(StubHandler):
+    routes = (
+        ("GET|HEAD", r"/", "info"),
+        ("GET", r"/([^/_][^/]*)/_mapping", "mapping"),
+        ("GET", r"/_cluster/state/metadata/([^/]+)", "cluster_state"),
+        ("GET", r"/_cat/indices/([^/]+)", "cat_indices"),
+        ("GET|POST", r"/([^/_][^/]*)/_search", "search"),
+        ("GET|POST", r"/_msearch", "msearch"),
+    )
+    extra_headers = {"X-Elastic-Product": "Elasticsearch"}
+
+    def indices(self, target):
+        patterns = target.split(",")
+        return [name for name in self.server.mappings if any(fnmatch.fnmatchcase(name, p) for p in patterns)]
+
+    def info(self):
+        self.send_json(200, {"name": "stub", "cluster_name": "bench", "version": {"number": "8.15.0"},
+                             "tagline": "You Know, for Search"})
+
+    def mapping(self, target):
+        self.send_json(200, {name: {"mappings": {"properties": self.server.mappings[name]}}
+                             for name in self.indices(target)})
+
+    def cluster_state(self, target):
+        self.send_json(200, {"metadata": {"indices": {
+            name: {"settings": {"index": {"uuid": self.index_uuid(name)}}, "mapping_version": 1}
+            for name in self.indices(target)
+        }}})
+
+    def cat_indices(self, target):
+        self.send_json(200, [{"index": name, "uuid": self.index_uuid(name), "docs.count": str(self.doc_count(name))}
+                             for name in self.indices(target)])
+
+    @staticmethod
+    def index_uuid(index_name):
+        return hashlib.md5(index_name.encode("utf-8")).hexdigest()[:22]
+
+    @staticmethod
+    def doc_count(index_name):
+        return 1 + zlib.crc32(index_name.encode("utf-8")) % 3
+
+    def search_response(self, index_name, body):
+        properties = self.server.mappings.get(index_name)
+        if properties is None:
+            return 404, {"error": {"type": "index_not_found_exception", "reason": f"no such index [{index_name}]"},
+                         "status": 404}
+        count = self.doc_count(index_name)
+        response = {"took": 1, "timed_out": False,
+                    "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0}}
+        aggs = body.get("aggs") or body.get("aggregations")
+        if aggs:
+            response["hits"] = {"total": {"value": count, "relation": "eq"}, "max_score": None, "hits": []}
+            response["aggregations"] = {name: {"value": stub_value(index_name, name)} for name in aggs}
+            return 200, response
+
+        source = body.get("_source", True)
+        if source is True:
+            fields = [name for name, spec in properties.items() if spec["type"] != "dense_vector"]
+        elif isinstance(source, list):
+            fields = source
+        else:
+            fields = []
+        hits = [{"_index": index_name, "_id": str(n), "_score": 1.0,
+                 "_source": {field: stub_value(index_name, field, n) for field in fields}}
+                for n in range(min(count, body.get("size", 10)))]
+        response["hits"] = {"total": {"value": count, "relation": "eq"}, "max_score": 1.0, "hits": hits}
+        return 200, response
+
+    def search(self, index_name):
+        body = self.read_json()
+        self.delay()
+        self.send_json(*self.search_response(index_name, body))
+
+    def msearch(self):
+        lines = [json.loads(line) for line in self.read_body().decode("utf-8").splitlines() if line.strip()]
+        self.delay()
+        responses = []
+        for header, body in zip(lines[::2], lines[1::2]):
+            status, response = self.search_response(header["index"], body)
+            responses.append({**response, "status": status})
+        self.send_json(200, {"took": 1, "responses": responses})
+
+
+HANDLERS = {"llm": LLMHandler, "clip": ClipHandler, "es": ESHandler}
+
+
+def serve(kind, config, port_queue, port=0):
+    server = ThreadingHTTPServer(("127.0.0.1", port), HANDLERS[kind])
+    server.daemon_threads = True
+    server.latency_s = config.get("latency_ms", 0) / 1000
+    server.token_s = config.get("token_ms", 0) / 1000
+    server.responses = config.get("responses", {})
+    server.markers = config.get("markers", ("", ""))
+    server.mappings = config.get("mappings", {})
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+class StubServer:
+    """One stand-in running in a child process; `url` is set once it listens."""
+
+    def __init__(self, kind, port=0, **config):
+        self.kind = kind
+        self.port = port
+        self.config = config
+        self.process = None
+        self.url = None
+
+    def start(self):
+        ports = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=serve, args=(self.kind, self.config, ports, self.port),
+                                               name=f"{self.kind}-stub", daemon=True)
+        self.process.start()
+        self.url = f"http://127.0.0.1:{ports.get(timeout=30)}"
+        return self
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+            self.process = None
+
+
+def start_stubs(items, llm_latency_ms=0, llm_token_ms=0, clip_latency_ms=0, es_latency_ms=0, es=True, ports=None):
+    """Start the LLM, CLIP and (unless es=False) ES stand-ins for `items`; returns {kind: StubServer}."""
+    ports = ports or {}
+    stubs = {
+        "llm": StubServer("llm", ports.get("llm", 0), responses=canned_responses(items), markers=question_markers(),
+                          latency_ms=llm_latency_ms, token_ms=llm_token_ms),
+        "clip": StubServer("clip", ports.get("clip", 0), latency_ms=clip_latency_ms),
+    }
+    if es:
+        stubs["es"] = StubServer("es", ports.get("es", 0), mappings=stub_mappings(items), latency_ms=es_latency_ms)
+    for stub in stubs.values():
+        stub.start()
+    return stubs
+
+
+def stop_stubs(stubs):
+    for stub in stubs.values():
+        stub.stop()
+
+
+if __name__ == "__main__":
+    from evaluation_scheduler import GROUPS
+
+    stubs = start_stubs(load_items(sys.argv[1:] or GROUPS), ports={"llm": 11434, "clip": 8000, "es": 9200})
+    print(f"✅ Stand-ins running: OLLAMA_HOST={stubs['llm'].url}/v1 CLIP_HOST={stubs['clip'].url} "
+          f"ELASTIC_HOST={stubs['es'].url}")
+    try:
+        for stub in stubs.values():
+            stub.process.join()
+    except KeyboardInterrupt:
+        stop_stubs(stubs)
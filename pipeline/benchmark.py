@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of the pipeline against local stand-ins.
+
+Starts the LLM, CLIP and ES stand-ins of bench_stubs.py, then runs the real
+PipelineEngine and EvaluationScheduler over the TEST_SET groups with a fresh
+gold store. Records items/s, per-stage latency percentiles (tracing.py
+summary) and peak RSS as JSON, and compares them with a stored baseline.
+No network, GPU or model is needed.
+
+    python benchmark.py [group ...] [--limit N] [--llm-latency-ms MS] ...
+    python benchmark.py --save-baseline          # store this run as the baseline
+
+The concurrency and batching knobs (LLM_CONCURRENCY, ES_CONCURRENCY,
+ES_BATCH_SIZE, LLM_STREAM, ...) are read from the environment as usual and
+recorded with the results. --es-host runs against a real cluster (e.g. the
+docker-compose single node with the tables uploaded) instead of the ES stub.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import resource
+import tempfile
+
+from bench_stubs import load_items, start_stubs, stop_stubs
+
+# evaluation_scheduler.GROUPS; importing it here would create the clients before the hosts are set
+GROUPS = ["agg", "other", "knn"]
+BENCH_OUTPUT = "benchmarks/latest.json"
+BENCH_BASELINE = "benchmarks/baseline.json"
+BENCH_TOLERANCE = float(os.getenv("BENCH_TOLERANCE", "0.10"))
+# Stage latencies below this are too small to compare run to run
+MIN_COMPARED_MS = 1.0
+
+# Environment knobs recorded with every run
+RECORDED_ENV = ("LLM_CONCURRENCY", "ES_CONCURRENCY", "GOLD_CONCURRENCY", "ES_BATCH_SIZE", "ES_BATCH_WAIT_MS",
+                "MSEARCH_CONCURRENCY", "LLM_STREAM", "PROMPT_LAYOUT", "MAPPING_FORMAT", "INDEX_LAYOUT",
+                "HTTP_POOL_SIZE")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline against local stand-ins.")
+    parser.add_argument("groups", nargs="*", default=GROUPS, help="TEST_SET groups to run (default: all)")
+    parser.add_argument("--limit", type=int, help="run only the first N items of each group")
+    parser.add_argument("--llm-latency-ms", type=float, default=0, help="delay of every LLM response")
+    parser.add_argument("--llm-token-ms", type=float, default=0, help="extra delay per generated token")
+    parser.add_argument("--clip-latency-ms", type=float, default=0, help="delay of every CLIP response")
+    parser.add_argument("--es-latency-ms", type=float, default=0, help="delay of every ES search")
+    parser.add_argument("--es-host", help="use this Elasticsearch instead of the stub")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="run the asyncio pipeline (async_pipeline.py) instead of the threaded one")
+    parser.add_argument("--output", default=BENCH_OUTPUT, help=f"results JSON (default: {BENCH_OUTPUT})")
+    parser.add_argument("--baseline", default=BENCH_BASELINE, help=f"baseline JSON (default: {BENCH_BASELINE})")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=BENCH_TOLERANCE,
+                        help="relative slowdown counted as a regression (default: $BENCH_TOLERANCE or 0.10)")
+    return parser.parse_args(argv)
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def run_benchmark(args, work_dir):
+    """Run the pipeline over the selected items; returns the results dict."""
+    items = load_items(args.groups, args.limit)
+    stubs = start_stubs(items, llm_latency_ms=args.llm_latency_ms, llm_token_ms=args.llm_token_ms,
+                        clip_latency_ms=args.clip_latency_ms, es_latency_ms=args.es_latency_ms,
+                        es=args.es_host is None)
+    try:
+        # Read by the pipeline modules at import, so set before importing them
+        os.environ["OLLAMA_HOST"] = f"{stubs['llm'].url}/v1"
+        os.environ["CLIP_HOST"] = stubs["clip"].url
+        os.environ["ELASTIC_HOST"] = args.es_host or stubs["es"].url
+        os.environ["GOLD_STORE_PATH"] = os.path.join(work_dir, "gold_results.sqlite")
+        os.environ["LLM_CACHE_MODE"] = "off"
+        os.environ["EMBEDDING_CACHE_PATH"] = ""
+
+        from evaluation_scheduler import EvaluationScheduler, load_group
+        from pipeline_engine import PipelineEngine
+        from tracing import Tracer
+        if args.use_async:
+            from async_pipeline import AsyncEvaluationScheduler, AsyncPipelineEngine
+
+        pipeline_items = []
+        for group in args.groups:
+            group_items = load_group(group)
+            pipeline_items.extend(group_items[:args.limit] if args.limit else group_items)
+
+        tracer = Tracer()
+        started = time.perf_counter()
+        if args.use_async:
+            # Starts inside the event loop, as part of evaluate()
+            engine = AsyncPipelineEngine(tracer=tracer)
+            scheduler = AsyncEvaluationScheduler(engine)
+        else:
+            engine = PipelineEngine(tracer=tracer)
+            scheduler = EvaluationScheduler(engine)
+        startup_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        results = scheduler.evaluate(pipeline_items)
+        wall_s = time.perf_counter() - started
+        stages = tracer.close()
+    finally:
+        stop_stubs(stubs)
+
+    return {
+        "config": {
+            "groups": args.groups,
+            "limit": args.limit,
+            "llm_latency_ms": args.llm_latency_ms,
+            "llm_token_ms": args.llm_token_ms,
+            "clip_latency_ms": args.clip_latency_ms,
+            "es_latency_ms": args.es_latency_ms,
+            "es": args.es_host or "stub",
+            "async": args.use_async,
+            "env": {name: os.environ[name] for name in RECORDED_ENV if name in os.environ},
+        },
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "items": len(pipeline_items),
+        "failures": len(scheduler.failures),
+        "correct": {group: {"correct": correct, "total": total} for group, (correct, total) in results.items()},
+        "startup_s": round(startup_s, 3),
+        "wall_s": round(wall_s, 3),
+        "items_per_s": round(len(pipeline_items) / wall_s, 3) if wall_s else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": stages,
+    }
+
+
+def compared_metrics(report):
+    """{metric: (value, higher_is_better)} of a results dict."""
+    metrics = {
+        "items_per_s": (report.get("items_per_s"), True),
+        "peak_rss_mb": (report.get("peak_rss_mb"), False),
+    }
+    for stage, groups in report.get("stages", {}).items():
+        stats = groups.get("all")
+        if stats is None or stage == "startup":
+            continue
+        for key in ("p50_ms", "p95_ms"):
+            metrics[f"{stage}.{key}"] = (stats[key], False)
+    return metrics
+
+
+def compare(report, baseline, tolerance):
+    """Print the change of every metric against the baseline; returns the regressed metric names."""
+    if report["config"] != baseline.get("config"):
+        print("⚠️ Baseline was recorded with a different configuration; the comparison is indicative only")
+
+    previous = compared_metrics(baseline)
+    regressions = []
+    print(f"{'metric':<22} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, (value, higher_is_better) in compared_metrics(report).items():
+        if name not in previous or value is None or not previous[name][0]:
+            continue
+        base = previous[name][0]
+        change = (value - base) / base
+        worse = -change if higher_is_better else change
+        regressed = worse > tolerance and not (name.endswith("_ms") and abs(value - base) < MIN_COMPARED_MS)
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<22} {base:>12.3f} {value:>12.3f} {change:>+8.1%}{' ❌' if regressed else ''}")
+    return regressions
+
+
+def write_json(path, data):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory(prefix="bench-") as work_dir:
+        report = run_benchmark(args, work_dir)
+
+    write_json(args.output, report)
+    print(f"📈 {report['items']} items in {report['wall_s']:.2f}s ({report['items_per_s']} items/s), "
+          f"peak RSS {report['peak_rss_mb']} MB, {report['failures']} failed; written to {args.output}")
+
+    regressions = []
+    if args.save_baseline:
+        write_json(args.baseline, report)
+        print(f"💾 Baseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} metrics regressed by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+        else:
+            print("✅ No regressions against the baseline")
+    return 1 if regressions or report["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,23 @@
+"""
+Scoring of generated queries against the gold queries.
+
+Both sides are extract_results() lists. Each value is reduced to a hashable,
+tolerance-free form: strings stripped, ints kept as ints, integral floats as
+ints (3 == 3.0), other floats exact, dicts and lists order-insensitive. The
+two sides are counted as multisets (Counter), so matching is O(n). Only
+the items left over after that exact match, and only when they hold a
+number, are paired up with math.isclose() tolerances (RESULT_REL_TOL,
+RESULT_ABS_TOL) on floats. Two ints always compare exactly.
+"""
+import os
+import math
+from collections import Counter
 from pathlib import Path
 
+# Floats match when math.isclose() with these tolerances (3.0 == 3.0000000001)
+RESULT_REL_TOL = float(os.getenv("RESULT_REL_TOL", "1e-9"))
+RESULT_ABS_TOL = float(os.getenv("RESULT_ABS_TOL", "1e-12"))
+
 def compare_files(file1_path, file2_path):
     try:
         content1 = Path(file1_path).read_text(encoding='utf-8').strip()
@@ -9,3 +27,103 @@ def compare_files(file1_path, file2_path):
         return 0
 
     return int(content1 == content2)
+
+def is_bucket(value):
+    return isinstance(value, dict) and "key" in value and "doc_count" in value
+
+def canonical(value):
+    """Hashable, order-insensitive form of an extracted value: nested (tag, ...) tuples."""
+    if isinstance(value, bool) or value is None:
+        return ("const", value)
+    if isinstance(value, int):
+        return ("number", value)
+    if isinstance(value, float):
+        # Exact; tolerances only apply to leftovers in multiset_matches()
+        return ("number", int(value) if value.is_integer() else value)
+    if isinstance(value, str):
+        return ("str", value.strip())
+    if is_bucket(value):
+        # Only the bucket itself counts, not key_as_string or formatting
+        return ("bucket", canonical(value["key"]), value["doc_count"])
+    if isinstance(value, dict):
+        return ("dict", frozenset((key, canonical(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return ("list", frozenset(Counter(canonical(item) for item in value).items()))
+    return ("repr", repr(value))
+
+def has_number(form):
+    """Whether a canonical form holds a number; items without one can only match exactly."""
+    if form[0] == "number":
+        return True
+    if form[0] == "bucket":
+        return has_number(form[1])
+    if form[0] == "dict":
+        return any(has_number(item) for _, item in form[1])
+    if form[0] == "list":
+        return any(has_number(item) for item, _ in form[1])
+    return False
+
+def matches(a, b, rel_tol=RESULT_REL_TOL, abs_tol=RESULT_ABS_TOL):
+    """Equality of two canonical forms, with floats compared by math.isclose()."""
+    if a[0] != b[0]:
+        return False
+    if a[0] == "number":
+        if isinstance(a[1], int) and isinstance(b[1], int):
+            return a[1] == b[1]
+        return math.isclose(a[1], b[1], rel_tol=rel_tol, abs_tol=abs_tol)
+    if a[0] == "bucket":
+        return a[2] == b[2] and matches(a[1], b[1], rel_tol, abs_tol)
+    if a[0] == "dict":
+        items_a, items_b = dict(a[1]), dict(b[1])
+        return items_a.keys() == items_b.keys() and all(
+            matches(items_a[key], items_b[key], rel_tol, abs_tol) for key in items_a
+        )
+    if a[0] == "list":
+        return multiset_matches(Counter(dict(a[1])), Counter(dict(b[1])), rel_tol, abs_tol)
+    return a == b
+
+def multiset_matches(a, b, rel_tol=RESULT_REL_TOL, abs_tol=RESULT_ABS_TOL):
+    """
+    Whether two Counters of canonical forms hold the same items. Exact
+    duplicates cancel out by hash; the few leftovers are paired greedily
+    with matches().
+    """
+    if sum(a.values()) != sum(b.values()):
+        return False
+    left_a = list((a - b).elements())
+    left_b = list((b - a).elements())
+    if not left_a:
+        return True
+    if not all(has_number(item) for item in left_a + left_b):
+        return False
+    for item in left_a:
+        for n, other in enumerate(left_b):
+            if matches(item, other, rel_tol, abs_tol):
+                del left_b[n]
+                break
+        else:
+            return False
+    return True
+
+def result_multiset(results):
+    """
+    Multiset of the extracted results of one query. Bucket lists are
+    flattened into their buckets, so hits, metric values and buckets all
+    compare regardless of order.
+    """
+    counts = Counter()
+    for value in results:
+        if isinstance(value, list) and value and all(is_bucket(item) for item in value):
+            counts.update(canonical(item) for item in value)
+        else:
+            counts[canonical(value)] += 1
+    return counts
+
+def compare_results(gold, predicted, rel_tol=RESULT_REL_TOL, abs_tol=RESULT_ABS_TOL):
+    """
+    1 when the predicted results match the gold results, else 0. Both are
+    extract_results() lists; None (query failed, table unknown) never matches.
+    """
+    if gold is None or predicted is None:
+        return 0
+    return int(multiset_matches(result_multiset(gold), result_multiset(predicted), rel_tol, abs_tol))
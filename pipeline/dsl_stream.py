@@ -0,0 +1,162 @@
+"""
+Incremental parsing of a streamed LLM completion.
+
+DslStreamParser is fed completion chunks as they arrive. It drops <think>
+blocks and Markdown fences on the fly and reports when the answer is
+complete: one balanced DSL JSON object, optionally followed by a "~"
+separator and the text to embed. The caller can then stop the request
+instead of waiting for the model to finish rambling.
+
+The "~" tail ends at a closing fence, at a blank line, or - when it starts
+with a double quote - at the closing quote that ends a line.
+"""
+import re
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+FENCE = "```"
+
+_MARKER = re.compile(r"<think>|</think>|```[A-Za-z]*")
+_PREFIXES = tuple(
+    marker[:n] for marker in (THINK_OPEN, THINK_CLOSE, FENCE) for n in range(1, len(marker) + 1)
+)
+
+
+class DslStreamParser:
+    def __init__(self):
+        self.done = False
+        self._raw = ""
+        self._in_think = False
+        self._kept = []
+        # JSON tracking
+        self._depth = 0
+        self._started = False
+        self._in_string = False
+        self._escape = False
+        self._json_done = False
+        # "~" tail tracking
+        self._in_tail = False
+        self._tail_quoted = None
+        self._tail_len = 0
+        self._blank_line = False
+        self._prev = self._prev2 = ""
+
+    def feed(self, chunk):
+        """Consume one chunk; returns True once the answer is complete."""
+        if self.done:
+            return True
+        self._raw += chunk
+        self._filter(final=False)
+        return self.done
+
+    def finish(self):
+        """Flush whatever is buffered once the stream has ended."""
+        if not self.done:
+            self._filter(final=True)
+        return self.text()
+
+    def text(self):
+        return "".join(self._kept).strip()
+
+    # --- Think blocks and fences ---
+
+    def _held_back(self, text):
+        """Length of a suffix of `text` that may be the start of a marker."""
+        for n in range(min(len(text), len(THINK_CLOSE)), 0, -1):
+            suffix = text[-n:]
+            if suffix in _PREFIXES or (suffix.startswith(FENCE) and suffix[3:].isalpha()):
+                return n
+        return 0
+
+    def _filter(self, final):
+        raw = self._raw
+        pos = 0
+        while not self.done:
+            match = _MARKER.search(raw, pos)
+            if match is None:
+                break
+            if match.group(0).startswith(FENCE) and match.end() == len(raw) and not final:
+                # The language tag of the fence may continue in the next chunk
+                break
+            if not self._in_think:
+                self._consume(raw[pos:match.start()])
+            if self.done:
+                return
+            marker = match.group(0)
+            if marker == THINK_OPEN:
+                self._in_think = True
+            elif marker == THINK_CLOSE:
+                self._in_think = False
+            elif self._in_tail and not self._in_think:
+                # A fence after the tail closes the answer
+                self.done = True
+                return
+            pos = match.end()
+
+        rest = raw[pos:]
+        keep = 0 if final else self._held_back(rest)
+        if not self._in_think:
+            self._consume(rest[:len(rest) - keep])
+        self._raw = rest[len(rest) - keep:] if keep else ""
+
+    # --- JSON object and tail ---
+
+    def _consume(self, text):
+        for ch in text:
+            if self.done:
+                return
+            if self._in_tail:
+                self._tail_char(ch)
+                continue
+            if self._json_done:
+                if ch == "~":
+                    self._in_tail = True
+                    self._kept.append(ch)
+                elif ch.isspace():
+                    self._kept.append(ch)
+                else:
+                    self.done = True
+                continue
+
+            self._kept.append(ch)
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._depth = 1
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._json_done = True
+
+    def _tail_char(self, ch):
+        self._kept.append(ch)
+        if self._tail_quoted is None:
+            if ch.isspace():
+                return
+            self._tail_quoted = ch == '"'
+            self._tail_len = 0
+        self._tail_len += 1
+
+        if ch == "\n":
+            if self._tail_quoted:
+                # A quoted tail ends at its closing quote followed by a newline
+                if self._tail_len > 2 and self._prev == '"' and self._prev2 != "\\":
+                    self.done = True
+            elif self._blank_line:
+                self.done = True
+            self._blank_line = True
+        elif not ch.isspace():
+            self._blank_line = False
+        self._prev2, self._prev = self._prev, ch
@@ -0,0 +1,134 @@
+"""
+Persistent, content-addressed cache of CLIP text embeddings.
+
+Vectors are stored as packed float32 blobs in SQLite, keyed by a SHA-256 of
+the model name and the normalized text. The database is bounded by
+EMBEDDING_CACHE_MAX_BYTES and evicts the least recently used vectors first.
+
+The same module is used by the pipeline (generate_embedding) and by the CLIP
+API, so both can share one cache file (EMBEDDING_CACHE_PATH).
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from array import array
+
+CLIP_MODEL = os.getenv("CLIP_MODEL", "openai/clip-vit-base-patch32")
+CLIP_BACKEND = os.getenv("CLIP_BACKEND", "torch")
+# Quantized / ONNX backends give slightly different vectors; keep them apart
+CACHE_MODEL_ID = CLIP_MODEL if CLIP_BACKEND == "torch" else f"{CLIP_MODEL}:{CLIP_BACKEND}"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "")
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# After an eviction the cache is trimmed to this fraction of max_bytes
+EVICT_TO = 0.9
+# Keys per SELECT ... IN (...) lookup, well under SQLite's bound-variable limit
+LOOKUP_CHUNK = 500
+
+
+def normalize_text(text):
+    """Unicode-normalize and collapse whitespace so trivially different texts share a key."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(model, text):
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, path, model=CACHE_MODEL_ID, max_bytes=EMBEDDING_CACHE_MAX_BYTES):
+        self.model = model
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings (last_used)")
+        self._conn.commit()
+        self._size = self._stored_bytes()
+
+    def _stored_bytes(self):
+        return self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+    def get_many(self, texts):
+        """Return {text: vector} for the texts that are cached."""
+        keys = {cache_key(self.model, text): text for text in texts}
+        if not keys:
+            return {}
+        found = {}
+        key_list = list(keys)
+        with self._lock:
+            rows = []
+            for start in range(0, len(key_list), LOOKUP_CHUNK):
+                chunk = key_list[start:start + LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows.extend(self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall())
+            if rows:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(time.time(), key) for key, _ in rows],
+                )
+                self._conn.commit()
+        for key, blob in rows:
+            vector = array("f")
+            vector.frombytes(blob)
+            found[keys[key]] = vector.tolist()
+        return found
+
+    def get(self, text):
+        return self.get_many([text]).get(text)
+
+    def put_many(self, items):
+        """Store (text, vector) pairs as float32 blobs."""
+        now = time.time()
+        rows = [(cache_key(self.model, text), array("f", vector).tobytes(), now) for text, vector in items]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows
+            )
+            self._conn.commit()
+            self._size += sum(len(blob) for _, blob, _ in rows)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def put(self, text, vector):
+        self.put_many([(text, vector)])
+
+    def _evict(self):
+        # Other processes may share the file, so start from the real size
+        self._size = self._stored_bytes()
+        excess = self._size - int(self.max_bytes * EVICT_TO)
+        if excess <= 0:
+            return
+        victims = []
+        for key, size in self._conn.execute(
+            "SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used"
+        ):
+            victims.append((key,))
+            excess -= size
+            self._size -= size
+            if excess <= 0:
+                break
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", victims)
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+
+def open_embedding_cache(path=EMBEDDING_CACHE_PATH, model=CACHE_MODEL_ID):
+    """Open the cache configured by EMBEDDING_CACHE_PATH, or return None when disabled."""
+    if not path:
+        return None
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    return EmbeddingCache(path, model)
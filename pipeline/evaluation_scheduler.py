@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Concurrent evaluation of the TEST_SET groups.
+
+Every item gets its own PipelineItem (and its own dump directory when
+OUTPUTS_DIR is set), so items can run side by side. Work is split across
+three bounded pools:
+
+- llm:  mapping + DSL generation (bound by the LLM server)
+- es:   embedding, injection and execution of the generated query
+- gold: execution of the ground truth query
+
+A failing stage fails only its item: the failure is reported (and recorded
+in the run store, see run_store.py) and the other items carry on.
+"""
+import os
+import sys
+import json
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from compare_results import compare_results
+from pipeline_engine import PipelineEngine, PipelineStageError, STAGE_INPUTS, downstream_stages, item_from_json
+from run_store import RUN_STORE_PATH, open_run_store
+from tracing import trace_span
+
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "1"))
+ES_CONCURRENCY = int(os.getenv("ES_CONCURRENCY", "4"))
+GOLD_CONCURRENCY = int(os.getenv("GOLD_CONCURRENCY", "4"))
+
+GROUPS = ["agg", "other", "knn"]
+TEST_SET_DIR = "data/TEST_SET"
+
+LLM_STAGES = ("mapping", "generate")
+EXEC_STAGES = ("embed", "inject", "execute")
+GOLD_STAGES = ("gold",)
+
+
+def load_group(group, test_set_dir=TEST_SET_DIR, outputs_dir=None):
+    """Read one TEST_SET group into PipelineItems with per-item dump dirs."""
+    items = []
+    with open(f"{test_set_dir}/{group}_query.jsonl", 'r', encoding='utf-8') as infile:
+        for n, line in enumerate(infile):
+            line = line.strip()
+            if not line:
+                continue
+            dump_dir = Path(outputs_dir) / group / str(n) if outputs_dir else None
+            items.append(item_from_json(json.loads(line), dump_dir=dump_dir, group=group, name=f"{group}/{n}"))
+    return items
+
+
+class EvaluationScheduler:
+    def __init__(self, engine, llm_workers=LLM_CONCURRENCY, es_workers=ES_CONCURRENCY,
+                 gold_workers=GOLD_CONCURRENCY, store=None):
+        self.engine = engine
+        self.llm_workers = llm_workers
+        self.es_workers = es_workers
+        self.gold_workers = gold_workers
+        self.store = store
+        # (item, stage, error) of every item that failed in this run
+        self.failures = []
+        self._lock = threading.Lock()
+
+    def _run_stages(self, item, stages):
+        for stage in stages:
+            # Outputs restored from the run store are not recomputed
+            if stage in item.outputs:
+                continue
+            self.engine.run_stage(item, stage)
+            if self.store is not None:
+                self.store.save_stage(item, stage)
+
+    def _generate_then_execute(self, item, es_pool):
+        self._run_stages(item, LLM_STAGES)
+        return es_pool.submit(self._run_stages, item, EXEC_STAGES)
+
+    def _record(self, item, counts, totals):
+        with trace_span(self.engine.tracer, item, "compare"):
+            correct = compare_results(item.results.get("gold"), item.results.get("execute"))
+        if self.store is not None:
+            self.store.finish(item, correct)
+        with self._lock:
+            counts[item.group] += correct
+            totals[item.group] += 1
+            print(f"[{item.group}] {counts[item.group]} / {totals[item.group]}")
+        return correct
+
+    def _fail(self, item, error):
+        if self.store is not None:
+            self.store.fail(item, error.stage, error.error)
+        with self._lock:
+            self.failures.append((item, error.stage, error.error))
+        print(f"❌ [{item.group}] {item.name or item.index_name} failed at step: {error.stage} ({error.error})",
+              file=sys.stderr)
+
+    def _restore(self, items, counts, totals):
+        """Load stored state; returns the items that still have to run."""
+        if self.store is None:
+            return items
+        remaining = []
+        for item in items:
+            status, correct = self.store.restore(item)
+            if status == "done":
+                counts[item.group] += correct
+                totals[item.group] += 1
+            else:
+                self.store.start(item)
+                remaining.append(item)
+        skipped = len(items) - len(remaining)
+        if skipped:
+            print(f"⏭️ Skipping {skipped} items already done in {self.store.path}")
+        return remaining
+
+    def evaluate(self, items):
+        """Run every item through all stages; returns {group: (correct, total)} over completed items."""
+        counts = {item.group: 0 for item in items}
+        totals = dict(counts)
+        items = self._restore(items, counts, totals)
+
+        with ThreadPoolExecutor(self.llm_workers, thread_name_prefix="llm") as llm_pool, \
+                ThreadPoolExecutor(self.es_workers, thread_name_prefix="es") as es_pool, \
+                ThreadPoolExecutor(self.gold_workers, thread_name_prefix="gold") as gold_pool:
+            pending = []
+            for item in items:
+                gold = gold_pool.submit(self._run_stages, item, GOLD_STAGES)
+                generated = llm_pool.submit(self._generate_then_execute, item, es_pool)
+                pending.append((item, gold, generated))
+
+            for item, gold, generated in pending:
+                try:
+                    generated.result().result()
+                    gold.result()
+                except PipelineStageError as e:
+                    self._fail(item, e)
+                    continue
+                self._record(item, counts, totals)
+
+        return {group: (counts[group], totals[group]) for group in counts}
+
+    def rerun_stage(self, items, stage):
+        """
+        Re-run one stage over the stored outputs of earlier stages, then the
+        stages that depend on it, and re-score the items. Items missing an
+        input of `stage` are skipped.
+        """
+        counts = {item.group: 0 for item in items}
+        totals = dict(counts)
+        # A new generation makes the stored embedding, query and results stale
+        stale = downstream_stages(stage)
+        ready = []
+        for item in items:
+            self.store.restore(item)
+            if all(name in item.outputs for name in STAGE_INPUTS[stage]):
+                for name in stale:
+                    item.outputs.pop(name, None)
+                    item.results.pop(name, None)
+                self.store.drop_stages(item, stale)
+                # Resumed by the next run if the re-run does not complete
+                self.store.start(item)
+                ready.append(item)
+        if len(ready) < len(items):
+            print(f"⏭️ {len(items) - len(ready)} items have no stored input for {stage}; skipping them")
+
+        with ThreadPoolExecutor(self.llm_workers, thread_name_prefix="llm") as llm_pool, \
+                ThreadPoolExecutor(self.es_workers, thread_name_prefix="es") as es_pool, \
+                ThreadPoolExecutor(self.gold_workers, thread_name_prefix="gold") as gold_pool:
+            futures = []
+            for item in ready:
+                # Stages whose outputs are still stored are skipped by _run_stages
+                if stage in GOLD_STAGES:
+                    future = gold_pool.submit(self._run_stages, item, GOLD_STAGES)
+                elif stage in LLM_STAGES:
+                    future = llm_pool.submit(self._generate_then_execute, item, es_pool)
+                else:
+                    future = es_pool.submit(self._run_stages, item, EXEC_STAGES)
+                futures.append((item, future))
+
+            for item, future in futures:
+                try:
+                    executed = future.result()
+                    if executed is not None:
+                        executed.result()
+                except PipelineStageError as e:
+                    self._fail(item, e)
+                    continue
+                # Items without a gold result are scored once it runs
+                if "execute" in item.outputs and "gold" in item.outputs:
+                    self._record(item, counts, totals)
+
+        return {group: (counts[group], totals[group]) for group in counts}
+
+def main(groups=GROUPS, outputs_dir=None, run_store=RUN_STORE_PATH, only_stage=None, fresh=False):
+    """Evaluate `groups`; returns ({group: (correct, total)}, failures)."""
+    items = []
+    for group in groups:
+        items.extend(load_group(group, outputs_dir=outputs_dir))
+
+    store = open_run_store(run_store)
+    if store is not None and fresh:
+        store.clear()
+    if only_stage and store is None:
+        raise ValueError("--only-stage needs a run store (--run-store or RUN_STORE_PATH)")
+
+    engine = PipelineEngine()
+    scheduler = EvaluationScheduler(engine, store=store)
+    try:
+        if only_stage:
+            results = scheduler.rerun_stage(items, only_stage)
+        else:
+            results = scheduler.evaluate(items)
+    finally:
+        # Trace summary per stage and group (TRACE_PATH)
+        if engine.tracer is not None:
+            engine.tracer.close()
+
+    for group, (correct, total) in results.items():
+        print(f"{group}: {correct} / {total}")
+    if scheduler.failures:
+        retry = f"run again with the same run store ({store.path}) to retry them" if store is not None \
+            else "set a run store to keep completed items across runs"
+        print(f"⚠️ {len(scheduler.failures)} items failed; {retry}", file=sys.stderr)
+    return results, scheduler.failures
+
+
+if __name__ == "__main__":
+    _, failures = main(sys.argv[1:] or GROUPS, outputs_dir=os.getenv("OUTPUTS_DIR"))
+    sys.exit(1 if failures else 0)
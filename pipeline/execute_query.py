@@ -1,27 +1,29 @@
+import io
+import os
 import sys
 import json
 from pathlib import Path
-import ast
-from elasticsearch import Elasticsearch, exceptions
+from itertools import chain
+from elasticsearch import exceptions
+from index_layout import get_layout
+from inject_embedding_into_query import InjectedQuery
+from http_clients import get_es_client
+from msearch import unwrap
+from knn_planner import plan_query
 
-# --- Use ELASTIC_HOST from environment (default to localhost:9200)
-import os
-ES_HOST = os.getenv("ELASTIC_HOST", "http://localhost:9200")
-es = Elasticsearch(ES_HOST)
+# ES returns only what extraction reads: hit sources and aggregations
+RESULT_FILTER_PATH = "hits.hits._source,aggregations"
+# Hit queries asking for more than this many hits are paged with search_after
+HITS_PAGE_SIZE = int(os.getenv("HITS_PAGE_SIZE", "1000"))
+PIT_KEEP_ALIVE = "1m"
 
-def main(index_name, input_file_path, output_file_path):
-    # Ensure the output directory exists
-    out_path = Path(output_file_path)
-    out_path.parent.mkdir(parents=True, exist_ok=True)
+_END = object()
 
-    try:
-        lines = Path(input_file_path).read_text(encoding="utf-8").splitlines()
-    except FileNotFoundError:
-        out_path.touch()  # create an empty file
-        print(f"[warn] {input_file_path} not found → created empty {output_file_path}")
-        return
+# Shared client for ELASTIC_HOST (default localhost:9200)
+es = get_es_client()
 
-    # Remove Markdown fences (``` or ```json)
+def strip_fences(lines):
+    """Drop the Markdown fences (``` or ```json) around an LLM-generated query."""
     if lines and lines[0].lstrip().startswith("```"):
         print(f"[info] Stripping Markdown fence: {lines[0].strip()}")
         lines = lines[1:]
@@ -33,46 +35,199 @@ def main(index_name, input_file_path, output_file_path):
         print(f"[info] Stripping closing fence: {lines[-1].strip()}")
         lines = lines[:-1]
 
+    return lines
+
+def iter_results(response):
+    """Yield the values a response answers with: _source values of the hits, or metric/bucket aggregations."""
+    if "aggregations" not in response:
+        for hit in response.get("hits", {}).get("hits", []):
+            yield from hit.get("_source", {}).values()
+    else:
+        for agg_data in response["aggregations"].values():
+            if "value" in agg_data:
+                yield agg_data["value"]
+            elif "buckets" in agg_data:
+                yield agg_data["buckets"]
+
+def extract_results(response):
+    """Flat list of iter_results(response)."""
+    return list(iter_results(response))
+
+def prepare_search(body):
+    """
+    Search body with nothing ES would compute only for us to drop: results of
+    an aggregation query are read from its aggregations, so it fetches no hits.
+    """
+    if ("aggs" in body or "aggregations" in body) and "size" not in body:
+        return {**body, "size": 0}
+    return body
+
+def wants_stream(body, page_size=HITS_PAGE_SIZE):
+    """True for hit queries asking for more hits than fit in one page."""
+    return ("aggs" not in body and "aggregations" not in body and "from" not in body
+            and isinstance(body.get("size"), int) and body["size"] > page_size)
+
+def page_sort(body):
+    """
+    Sort of a paged search: the query's own sort (relevance when it has none,
+    as in a one-shot search) plus the _shard_doc tiebreaker search_after needs.
+    """
+    sort = body.get("sort") or [{"_score": "desc"}]
+    return (sort if isinstance(sort, list) else [sort]) + [{"_shard_doc": "asc"}]
+
+def iter_hits(es_client, index_name, body, routing=None, page_size=HITS_PAGE_SIZE):
+    """
+    Yield the hits of a large search page by page with search_after over a
+    point in time, holding one page in memory at a time.
+    """
+    remaining = body["size"]
+    pit_id = es_client.open_point_in_time(index=index_name, keep_alive=PIT_KEEP_ALIVE, routing=routing)["id"]
+    try:
+        page = dict(body, sort=page_sort(body))
+        while remaining > 0:
+            page["size"] = min(page_size, remaining)
+            page["pit"] = {"id": pit_id, "keep_alive": PIT_KEEP_ALIVE}
+            response = es_client.search(body=page, filter_path="pit_id,hits.hits._source,hits.hits.sort")
+            hits = response.get("hits", {}).get("hits", [])
+            if not hits:
+                return
+            yield from hits
+            remaining -= len(hits)
+            page["search_after"] = hits[-1]["sort"]
+            pit_id = response.get("pit_id", pit_id)
+    finally:
+        es_client.close_point_in_time(id=pit_id)
+
+def search_results(es_client, index_name, body, routing=None):
+    """Extracted results of one search, paging through large hit sets."""
+    if wants_stream(body):
+        # Point in time searches bypass the _msearch batcher
+        client = unwrap(es_client)
+        return [value for hit in iter_hits(client, index_name, body, routing)
+                for value in hit.get("_source", {}).values()]
+    response = es_client.search(index=index_name, body=prepare_search(body), routing=routing,
+                                filter_path=RESULT_FILTER_PATH)
+    return extract_results(response)
+
+async def aiter_hits(es_client, index_name, body, routing=None, page_size=HITS_PAGE_SIZE):
+    """iter_hits() over an AsyncElasticsearch client."""
+    remaining = body["size"]
+    pit_id = (await es_client.open_point_in_time(index=index_name, keep_alive=PIT_KEEP_ALIVE, routing=routing))["id"]
+    try:
+        page = dict(body, sort=page_sort(body))
+        while remaining > 0:
+            page["size"] = min(page_size, remaining)
+            page["pit"] = {"id": pit_id, "keep_alive": PIT_KEEP_ALIVE}
+            response = await es_client.search(body=page, filter_path="pit_id,hits.hits._source,hits.hits.sort")
+            hits = response.get("hits", {}).get("hits", [])
+            if not hits:
+                return
+            for hit in hits:
+                yield hit
+            remaining -= len(hits)
+            page["search_after"] = hits[-1]["sort"]
+            pit_id = response.get("pit_id", pit_id)
+    finally:
+        await es_client.close_point_in_time(id=pit_id)
+
+async def asearch_results(es_client, index_name, body, routing=None):
+    """search_results() over an AsyncElasticsearch client."""
+    if wants_stream(body):
+        return [value async for hit in aiter_hits(es_client, index_name, body, routing)
+                for value in hit.get("_source", {}).values()]
+    response = await es_client.search(index=index_name, body=prepare_search(body), routing=routing,
+                                      filter_path=RESULT_FILTER_PATH)
+    return extract_results(response)
+
+def write_results(results, f):
+    """Write results to `f` as format_results() renders them, without building the text."""
+    values = iter(results)
+    first = next(values, _END)
+    if first is _END:
+        f.write("[]")
+        return
+    second = next(values, _END)
+    if second is _END:
+        f.write(json.dumps(first, indent=2))
+        return
+    f.write("[")
+    for n, value in enumerate(chain((first, second), values)):
+        # Equivalent to json.dumps(results, indent=2): JSON strings hold no raw newlines
+        f.write(",\n  " if n else "\n  ")
+        f.write(json.dumps(value, indent=2).replace("\n", "\n  "))
+    f.write("\n]")
+
+def format_results(results):
+    buffer = io.StringIO()
+    write_results(results, buffer)
+    return buffer.getvalue()
+
+def parse_query_text(query_text):
+    """Parse a query.txt-style query; returns (body, None) or (None, final_result error text)."""
+    lines = strip_fences(query_text.splitlines())
+
     raw = "\n".join(lines).strip()
     if not raw:
         print("⚠️ No JSON found in input file.")
-        out_path.write_text("No JSON found between fences.")
-        return
+        return None, "No JSON found between fences."
 
     try:
-        query_template = json.loads(raw)
+        return json.loads(raw), None
     except json.JSONDecodeError as e:
         print("❌ Invalid JSON:", e)
-        out_path.write_text("Invalid JSON format in input query file.")
-        return
+        return None, "Invalid JSON format in input query file."
 
-    try:
-        response = es.search(index=index_name, body=query_template)
+def error_text(e):
+    """The final_result text of a query that failed with `e`."""
+    if isinstance(e, exceptions.BadRequestError):
+        return "BadRequestError: " + str(e.info)
+    if isinstance(e, exceptions.ApiError):
+        return "ApiError: " + str(e.info)
+    return "Unexpected error: " + str(e)
 
-        results = []
-        if "aggregations" not in response:
-            for hit in response.get("hits", {}).get("hits", []):
-                parsed = ast.literal_eval(f"{hit['_source']}")
-                results.extend(list(parsed.values()))
-        else:
-            for agg_data in response.get("aggregations", {}).values():
-                if "value" in agg_data:
-                    results.append(agg_data["value"])
-                elif "buckets" in agg_data:
-                    results.append(agg_data["buckets"])
-
-        if results:
-            results = results if len(results) > 1 else results[0]
-            out_path.write_text(json.dumps(results, indent=2))
-        else:
-            out_path.write_text("[]")
+def execute(es_client, index_name, query, layout=None, render=True):
+    """
+    Execute an LLM-generated query, given as an InjectedQuery or as text.
+    Returns (final_result text, extracted results), where the results are
+    None when the query could not be run. With render=False the text of a
+    successful query is not built (None); write it with write_results().
+    """
+    if isinstance(query, InjectedQuery):
+        query_template, error = query.body, query.error
+    else:
+        query_template, error = parse_query_text(query)
+    if query_template is None:
+        return error, None
+
+    try:
+        # Shared layout: search the shared index, scoped to this table
+        layout = layout or get_layout(es_client)
+        # KNN_PLAN: bool.must knn clauses as a top-level knn search; see knn_planner
+        physical_index, query_template, routing = layout.scope(index_name, plan_query(query_template))
+        results = search_results(es_client, physical_index, query_template, routing)
+        return (format_results(results) if render else None), results
 
-    except exceptions.BadRequestError as e:
-        out_path.write_text("BadRequestError: " + str(e.info))
-    except exceptions.ApiError as e:
-        out_path.write_text("ApiError: " + str(e.info))
     except Exception as e:
-        out_path.write_text("Unexpected error: " + str(e))
+        return error_text(e), None
+
+def main(index_name, input_file_path, output_file_path):
+    # Ensure the output directory exists
+    out_path = Path(output_file_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+
+    try:
+        query_text = Path(input_file_path).read_text(encoding="utf-8")
+    except FileNotFoundError:
+        out_path.touch()  # create an empty file
+        print(f"[warn] {input_file_path} not found → created empty {output_file_path}")
+        return
+
+    text, results = execute(es, index_name, query_text, render=False)
+    with open(out_path, 'w', encoding='utf-8') as f:
+        if results is None:
+            f.write(text)
+        else:
+            write_results(results, f)
 
 # --- Script mode: accept args from subprocess.run
 if __name__ == "__main__":
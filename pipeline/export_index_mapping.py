@@ -1,37 +1,30 @@
 from elasticsearch import Elasticsearch
-import os
 import sys
-import time
-import requests
+from mapping_cache import render_mapping
+from http_clients import get_es_client, get_es_service
 
 
 def wait_for_elasticsearch():
-    host = os.getenv("ELASTIC_HOST", "http://localhost:9200")
-    print(f"⏳ Waiting for Elasticsearch at {host}...")
-    for _ in range(30):
-        try:
-            r = requests.get(host)
-            if r.status_code == 200:
-                print("✅ Elasticsearch is ready.")
-                return
-        except:
-            pass
-        time.sleep(2)
-    raise Exception("❌ Elasticsearch is not reachable after 60 seconds.")
+    # Cached: returns at once if ES answered within HEALTH_CHECK_TTL
+    get_es_service().wait_until_healthy()
 
 
 def create_es_connection() -> Elasticsearch:
-    ES_HOST = os.getenv("ELASTIC_HOST", "http://localhost:9200")
-    return Elasticsearch(ES_HOST)
+    return get_es_client()
+
+def get_index_mapping(es_client, index_name) -> str:
+    """Return the mapping of `index_name` rendered the way the prompt expects it."""
+    mapping = es_client.indices.get_mapping(index=index_name)
+    return render_mapping(mapping.body)
 
 def main(index_name, output_file_path):
     # Get index mapping
     wait_for_elasticsearch()
     es_client = create_es_connection()
-    mapping = es_client.indices.get_mapping(index=index_name)
+    mapping = get_index_mapping(es_client, index_name)
     # Save the output to a file
     with open(output_file_path, 'w') as f:
-        f.write(str(mapping))
+        f.write(mapping)
 
 if __name__ == "__main__":
 
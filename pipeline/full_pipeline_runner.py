@@ -1,59 +1,59 @@
 #!/usr/bin/env python3
-import subprocess
+import os
 import sys
 import json
-from pathlib import Path
-from compare_results import compare_files  # Updated name
+import argparse
+import evaluation_scheduler
+from pipeline_engine import STAGES, PipelineEngine, item_from_json
+from run_store import RUN_STORE_PATH
 
-def run(cmd_list):
-    subprocess.run(cmd_list, check=True)
+# Set OUTPUTS_DIR (e.g. "outputs") to dump every stage result to disk for debugging
+OUTPUTS_DIR = os.getenv("OUTPUTS_DIR")
 
-def main(index_name, nlq, json_data):
-    # Ensure outputs directory exists
-    Path("outputs").mkdir(exist_ok=True)
-
-    # 1. index mapping prep
-    run(["python3", "export_index_mapping.py", index_name, "outputs/mapping.txt"])
-
-    # 2. LLM DSL generation
-    run(["python3", "generate_query_from_nlq.py", nlq, "outputs/mapping.txt", "outputs/llm_response.txt"])
-
-    # 3. Embedding
-    run(["python3", "generate_embedding.py", "outputs/llm_response.txt", "outputs/embedding.txt"])
-
-    # 4. Inject embedding into query
-    run(["python3", "inject_embedding_into_query.py", "outputs/llm_response.txt", "outputs/embedding.txt", "outputs/query.txt"])
+_engine = None
 
-    # 5. Execute query
-    run(["python3", "execute_query.py", index_name, "outputs/query.txt", "outputs/final_result.txt"])
+def get_engine():
+    global _engine
+    if _engine is None:
+        _engine = PipelineEngine()
+    return _engine
 
-    # 6. Execute ground truth query
-    run(["python3", "run_correct_query.py", json_data, "outputs/correct_result.txt"])
+def main(index_name, nlq, json_data):
+    item = item_from_json(json.loads(json_data), dump_dir=OUTPUTS_DIR)
+    item.index_name = index_name
+    item.nlq = nlq
+    get_engine().run(item)
 
     print("✅ Query run complete")
+    return item
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate the TEST_SET groups.")
+    parser.add_argument("groups", nargs="*", default=evaluation_scheduler.GROUPS,
+                        help="TEST_SET groups to evaluate (default: all)")
+    parser.add_argument("--outputs-dir", default=OUTPUTS_DIR,
+                        help="dump every stage result under this directory (default: $OUTPUTS_DIR)")
+    parser.add_argument("--run-store", default=RUN_STORE_PATH,
+                        help="SQLite run store; done items are skipped, failed ones resumed (default: $RUN_STORE_PATH)")
+    parser.add_argument("--fresh", action="store_true", help="clear the run store before starting")
+    parser.add_argument("--only-stage", choices=STAGES,
+                        help="re-run this stage and the ones depending on it over the stored outputs of earlier stages")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="run all items on one asyncio event loop (async_pipeline.py)")
+    args = parser.parse_args(argv)
+    if args.use_async and args.only_stage:
+        parser.error("--only-stage runs on the threaded scheduler; drop --async")
+    return args
 
 if __name__ == "__main__":
-    total = 0
-    groups = ["agg", "other", "knn"]
-    for group in groups:
-        correct_count = 0
-        input_file = f"data/TEST_SET/{group}_query.jsonl"
-
-        with open(input_file, 'r', encoding='utf-8') as infile:
-            for line in infile:
-                line = line.strip()
-                data = json.loads(line)
-                table_id = data["table_id"]
-                index_name = f"table{table_id.replace('-', '_')[1:]}"
-                nlq = data["question"]
-                json_data = json.dumps(data)
-
-                try:
-                    total += 1
-                    main(index_name, nlq, json_data)
-                    correct_count += compare_files("outputs/correct_result.txt", "outputs/final_result.txt")
-                except subprocess.CalledProcessError as e:
-                    print(f"Pipeline failed at step: {e.cmd}", file=sys.stderr)
-                    sys.exit(1)
-
-                print(f"{correct_count} / {total}")
+    args = parse_args()
+    # Items run concurrently; see evaluation_scheduler for the
+    # LLM_CONCURRENCY / ES_CONCURRENCY / GOLD_CONCURRENCY limits
+    if args.use_async:
+        import async_pipeline
+        _, failures = async_pipeline.main(args.groups, outputs_dir=args.outputs_dir, run_store=args.run_store,
+                                          fresh=args.fresh)
+    else:
+        _, failures = evaluation_scheduler.main(args.groups, outputs_dir=args.outputs_dir, run_store=args.run_store,
+                                                only_stage=args.only_stage, fresh=args.fresh)
+    sys.exit(1 if failures else 0)
@@ -1,28 +1,46 @@
-import os
-import requests
 import sys
+from embedding_cache import open_embedding_cache
+from tracing import annotate
+from http_clients import get_clip_client
 
-CLIP_HOST = os.getenv("CLIP_HOST", "http://localhost:8000")
+# Shared with the CLIP API when EMBEDDING_CACHE_PATH points at the same file
+embedding_cache = open_embedding_cache()
 
 def get_embedding(text):
-    response = requests.post(
-        f"{CLIP_HOST}/text-embedding/",
-        json={"text": text},
-        headers={"Content-Type": "application/json"}
-    )
-    return response.json()["embedding"][0]
+    if embedding_cache is not None:
+        cached = embedding_cache.get(text)
+        if cached is not None:
+            annotate(embedding_cache="hit")
+            return cached
 
-def main(input_file_path, output_file_path):
-    with open(input_file_path, 'r') as f:
-        result = f.read().strip()
+    # Pooled session with timeouts, retries and a circuit breaker (CLIP_HOST)
+    response = get_clip_client().post("/embed", json={"text": text})
+    embedding = response.json()["embedding"]
 
+    if embedding_cache is not None:
+        embedding_cache.put(text, embedding)
+    return embedding
+
+def embedding_text(result):
+    """The text after the "~" separator of an LLM response, or None."""
+    result = result.strip()
     if "~" not in result:
-        with open(output_file_path, 'w') as f:
-            f.write('')
-        return
+        return None
 
     query_template, text = result.split('~', 1)
-    output = str(get_embedding(text))
+    return text
+
+def embed_llm_response(result):
+    """Embed the text after the "~" separator of an LLM response, or return None."""
+    text = embedding_text(result)
+    return None if text is None else get_embedding(text)
+
+def main(input_file_path, output_file_path):
+    with open(input_file_path, 'r') as f:
+        result = f.read()
+
+    embedding = embed_llm_response(result)
+    output = '' if embedding is None else str(embedding)
 
     with open(output_file_path, 'w') as f:
         f.write(output)
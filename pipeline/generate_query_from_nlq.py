@@ -3,34 +3,35 @@ import openai
 import re
 import os
 import sys
+import string
+import threading
+
+from llm_cache import LLMResponseCache
+from dsl_stream import DslStreamParser
+from tracing import annotate
+from http_clients import LLM_TIMEOUT, install_llm_session, llm_breaker, aretry
 
 PROMPT_TEMPLATE_PATH = "inputs/prompt.txt"
+LLM_MODEL = os.getenv("LLM_MODEL", "qwen2.5-coder:14b")  # Must match `ollama list`
+SAMPLING_PARAMS = {"temperature": 0.7}
+# Stream the completion and stop as soon as the DSL (+ "~" text) is complete
+LLM_STREAM = os.getenv("LLM_STREAM", "0") == "1"
+# split:  static few-shot prefix as the system message, mapping + NLQ as the user message
+# single: the whole prompt as one user message (the layout of completions recorded before)
+PROMPT_LAYOUT = os.getenv("PROMPT_LAYOUT", "split")
 
 
 openai.api_base = os.getenv("OLLAMA_HOST", "http://host.docker.internal:11434/v1")
 openai.api_key = "ollama"
+# One pooled, retrying session for every completion request
+install_llm_session()
 
-def load_prompt_template():
-    with open(PROMPT_TEMPLATE_PATH, 'r', encoding='utf-8') as f:
-        return f.read()
-
-def get_qwen_response(prompt_text: str) -> str:
-    """
-    Send the prompt to Qwen via Ollama in OpenAI-compatible format.
-    """
-    response = openai.ChatCompletion.create(
-        model="qwen2.5-coder:14b",  # Must match `ollama list`
-        messages=[{"role": "user", "content": prompt_text}],
-        temperature=0.7,
-        stream=False,
-    )
-    text = response.choices[0].message.content
-    return re.sub(r"<think>.*?</think>\s*", "", text, flags=re.DOTALL).strip()
-
-def get_response(index_mapping: str, nl_query: str) -> str:
+# Record / replay raw completions (LLM_CACHE_MODE, LLM_CACHE_PATH)
+llm_cache = LLMResponseCache()
 
-    example_nlq = "How many schools are in a location characterized as: \"Bloomington is a city in Monroe County, Indiana, United States, and its county seat. The population was 79,168 at the 2020 census. It is the seventh‑most populous city in Indiana and the fourth‑most populous outside the Indianapolis metropolitan area. It is the home of Indiana University Bloomington, the flagship campus of the Indiana University system. Established in 1820, IU Bloomington enrolls over 45,000 students. The city was established in 1818 by a group of settlers from Kentucky, Tennessee, the Carolinas, and Virginia who were so impressed with \\\"a haven of blooms\\\" that they called it Bloomington. It is the principal city of the Bloomington metropolitan area in south‑central Indiana, which had 161,039 residents in 2020. Bloomington has been designated a Tree City USA since 1984. The city was also the location of the Academy Award–winning 1979 movie Breaking Away, featuring a reenactment of Indiana University's annual Little 500 bicycle race.\""
-    example_output_query = """
+# Few-shot examples; the same for every query, so formatted into the prefix once
+example_nlq = "How many schools are in a location characterized as: \"Bloomington is a city in Monroe County, Indiana, United States, and its county seat. The population was 79,168 at the 2020 census. It is the seventh‑most populous city in Indiana and the fourth‑most populous outside the Indianapolis metropolitan area. It is the home of Indiana University Bloomington, the flagship campus of the Indiana University system. Established in 1820, IU Bloomington enrolls over 45,000 students. The city was established in 1818 by a group of settlers from Kentucky, Tennessee, the Carolinas, and Virginia who were so impressed with \\\"a haven of blooms\\\" that they called it Bloomington. It is the principal city of the Bloomington metropolitan area in south‑central Indiana, which had 161,039 residents in 2020. Bloomington has been designated a Tree City USA since 1984. The city was also the location of the Academy Award–winning 1979 movie Breaking Away, featuring a reenactment of Indiana University's annual Little 500 bicycle race.\""
+example_output_query = """
     {
       "query": {
         "bool": {
@@ -58,9 +59,9 @@ def get_response(index_mapping: str, nl_query: str) -> str:
       ]
     }
     """
-    example_vector_content  = "\"Bloomington is a city in Monroe County, Indiana, United States, and its county seat. The population was 79,168 at the 2020 census. It is the seventh‑most populous city in Indiana and the fourth‑most populous outside the Indianapolis metropolitan area. It is the home of Indiana University Bloomington, the flagship campus of the Indiana University system. Established in 1820, IU Bloomington enrolls over 45,000 students. The city was established in 1818 by a group of settlers from Kentucky, Tennessee, the Carolinas, and Virginia who were so impressed with \\\"a haven of blooms\\\" that they called it Bloomington. It is the principal city of the Bloomington metropolitan area in south‑central Indiana, which had 161,039 residents in 2020. Bloomington has been designated a Tree City USA since 1984. The city was also the location of the Academy Award–winning 1979 movie Breaking Away, featuring a reenactment of Indiana University's annual Little 500 bicycle race.\""
-    example_nlq_2 = "Tell me what the notes are for South Australia"
-    example_output_query_2 = """
+example_vector_content = "\"Bloomington is a city in Monroe County, Indiana, United States, and its county seat. The population was 79,168 at the 2020 census. It is the seventh‑most populous city in Indiana and the fourth‑most populous outside the Indianapolis metropolitan area. It is the home of Indiana University Bloomington, the flagship campus of the Indiana University system. Established in 1820, IU Bloomington enrolls over 45,000 students. The city was established in 1818 by a group of settlers from Kentucky, Tennessee, the Carolinas, and Virginia who were so impressed with \\\"a haven of blooms\\\" that they called it Bloomington. It is the principal city of the Bloomington metropolitan area in south‑central Indiana, which had 161,039 residents in 2020. Bloomington has been designated a Tree City USA since 1984. The city was also the location of the Academy Award–winning 1979 movie Breaking Away, featuring a reenactment of Indiana University's annual Little 500 bicycle race.\""
+example_nlq_2 = "Tell me what the notes are for South Australia"
+example_output_query_2 = """
     {
       "query": {
         "bool": {
@@ -81,9 +82,172 @@ def get_response(index_mapping: str, nl_query: str) -> str:
       ]
     }
     """
-    template   = load_prompt_template()
-    prompt_txt = template.format(example_nlq=example_nlq, example_output_query=example_output_query, example_nlq_2 =example_nlq_2, example_output_query_2 =example_output_query_2, example_vector_content=example_vector_content, index_mapping=index_mapping, nl_query=nl_query)
-    return get_qwen_response(prompt_txt)
+
+EXAMPLES = {
+    "example_nlq": example_nlq,
+    "example_output_query": example_output_query,
+    "example_vector_content": example_vector_content,
+    "example_nlq_2": example_nlq_2,
+    "example_output_query_2": example_output_query_2,
+}
+
+def load_prompt_template():
+    with open(PROMPT_TEMPLATE_PATH, 'r', encoding='utf-8') as f:
+        return f.read()
+
+class PromptTemplate:
+    """
+    inputs/prompt.txt compiled once. Everything before {index_mapping} is
+    static and formatted with the examples up front; only the short suffix
+    (mapping, NLQ and closing instruction) is filled in per query, so the
+    LLM server sees the same prefix every time and can reuse its KV cache.
+    """
+
+    def __init__(self, template, examples=EXAMPLES, layout=PROMPT_LAYOUT):
+        if layout not in ("split", "single"):
+            raise ValueError(f"PROMPT_LAYOUT must be 'split' or 'single', got {layout!r}")
+        head, tail = template.split("{index_mapping}", 1)
+        self.layout = layout
+        self.prefix = head.format(**examples)
+        # Literal text and field names of the suffix, so rendering is a join
+        self.suffix_parts = []
+        for literal, field, spec, conversion in string.Formatter().parse("{index_mapping}" + tail):
+            if spec or conversion:
+                raise ValueError(f"Unsupported format spec in prompt suffix: {{{field}!{conversion}:{spec}}}")
+            self.suffix_parts.append((literal, field))
+
+    def suffix(self, **fields):
+        return "".join(literal + (fields[field] if field is not None else "")
+                       for literal, field in self.suffix_parts)
+
+    def text(self, index_mapping, nl_query):
+        """The full prompt, identical to template.format(...) of the original template."""
+        return self.prefix + self.suffix(index_mapping=index_mapping, nl_query=nl_query)
+
+    def messages(self, index_mapping, nl_query):
+        suffix = self.suffix(index_mapping=index_mapping, nl_query=nl_query)
+        if self.layout == "single":
+            return [{"role": "user", "content": self.prefix + suffix}]
+        return [{"role": "system", "content": self.prefix}, {"role": "user", "content": suffix}]
+
+_prompt = None
+_prompt_lock = threading.Lock()
+
+def get_prompt():
+    global _prompt
+    with _prompt_lock:
+        if _prompt is None:
+            _prompt = PromptTemplate(load_prompt_template())
+        return _prompt
+
+def stream_completion(messages) -> str:
+    parser = DslStreamParser()
+    chunks = openai.ChatCompletion.create(
+        model=LLM_MODEL,
+        messages=messages,
+        stream=True,
+        request_timeout=LLM_TIMEOUT,
+        **SAMPLING_PARAMS,
+    )
+    received = 0
+    try:
+        for chunk in chunks:
+            # Ollama streams one token per chunk
+            received += 1
+            delta = chunk.choices[0].delta.get("content")
+            if delta and parser.feed(delta):
+                break
+    finally:
+        # Dropping the stream closes the connection, which stops generation
+        chunks.close()
+        annotate(completion_tokens=received)
+    return parser.finish()
+
+def request_completion(messages) -> str:
+    # Fail fast while the LLM server is down instead of waiting out every item
+    if LLM_STREAM:
+        return llm_breaker.call(stream_completion, messages)
+    response = llm_breaker.call(
+        openai.ChatCompletion.create,
+        model=LLM_MODEL,
+        messages=messages,
+        stream=False,
+        request_timeout=LLM_TIMEOUT,
+        **SAMPLING_PARAMS,
+    )
+    usage = response.get("usage") or {}
+    annotate(prompt_tokens=usage.get("prompt_tokens", 0), completion_tokens=usage.get("completion_tokens", 0))
+    return response.choices[0].message.content
+
+# Errors the async client retries; the sync session retries the same statuses
+LLM_RETRYABLE = (openai.error.APIConnectionError, openai.error.ServiceUnavailableError, openai.error.RateLimitError)
+
+def _request(prompt):
+    """(messages, cache params) of a prompt given as text or chat messages."""
+    messages = [{"role": "user", "content": prompt}] if isinstance(prompt, str) else prompt
+    # Early-stopped completions differ from full ones, so they are cached apart
+    params = dict(SAMPLING_PARAMS, early_stop=True) if LLM_STREAM else SAMPLING_PARAMS
+    return messages, params
+
+def clean_response(text) -> str:
+    return re.sub(r"<think>.*?</think>\s*", "", text, flags=re.DOTALL).strip()
+
+def get_qwen_response(prompt) -> str:
+    """
+    Send the prompt (text or chat messages) to Qwen via Ollama in OpenAI-compatible format.
+    """
+    messages, params = _request(prompt)
+    text = llm_cache.complete(LLM_MODEL, messages, params, lambda: request_completion(messages))
+    return clean_response(text)
+
+def get_response(index_mapping: str, nl_query: str) -> str:
+    return get_qwen_response(get_prompt().messages(index_mapping, nl_query))
+
+# --- asyncio variants (async_pipeline.py); openai.aiosession holds the pooled session ---
+
+async def astream_completion(messages) -> str:
+    parser = DslStreamParser()
+    chunks = await openai.ChatCompletion.acreate(
+        model=LLM_MODEL,
+        messages=messages,
+        stream=True,
+        request_timeout=LLM_TIMEOUT,
+        **SAMPLING_PARAMS,
+    )
+    received = 0
+    try:
+        async for chunk in chunks:
+            received += 1
+            delta = chunk.choices[0].delta.get("content")
+            if delta and parser.feed(delta):
+                break
+    finally:
+        # Releases the unfinished response, which closes its connection
+        await chunks.aclose()
+        annotate(completion_tokens=received)
+    return parser.finish()
+
+async def arequest_completion(messages) -> str:
+    if LLM_STREAM:
+        return await llm_breaker.acall(aretry, lambda: astream_completion(messages), LLM_RETRYABLE)
+    response = await llm_breaker.acall(aretry, lambda: openai.ChatCompletion.acreate(
+        model=LLM_MODEL,
+        messages=messages,
+        stream=False,
+        request_timeout=LLM_TIMEOUT,
+        **SAMPLING_PARAMS,
+    ), LLM_RETRYABLE)
+    usage = response.get("usage") or {}
+    annotate(prompt_tokens=usage.get("prompt_tokens", 0), completion_tokens=usage.get("completion_tokens", 0))
+    return response.choices[0].message.content
+
+async def aget_qwen_response(prompt) -> str:
+    messages, params = _request(prompt)
+    text = await llm_cache.acomplete(LLM_MODEL, messages, params, lambda: arequest_completion(messages))
+    return clean_response(text)
+
+async def aget_response(index_mapping: str, nl_query: str) -> str:
+    return await aget_qwen_response(get_prompt().messages(index_mapping, nl_query))
 
 def main(nlq: str, mapping_path: str, output_path: str):
     with open(mapping_path, 'r', encoding='utf-8') as f:
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Compiled gold-query builders.
+
+A table schema is compiled once into a TableQueryBuilder: the index name,
+the cleaned column names and, per column, a condition encoder chosen by the
+column type. Building the gold DSL of a WikiSQL query is then a handful of
+list lookups. Builders are memoized per table id.
+
+compile_dataset() converts whole TEST_SET groups in one pass into an
+`_msearch` NDJSON file, with a `.ids` file naming the item of each search:
+
+    python gold_compiler.py [output.ndjson] [group ...]
+"""
+import sys
+import json
+
+from table_metadata import HEADERS_CSV, TYPES_CSV, get_store
+from knn_planner import plan_query
+
+AGG_OPS = ['', 'max', 'min', 'value_count', 'sum', 'avg']
+COND_OPS = ['=', '>', '<', 'OP']
+
+KNN_K = 20
+KNN_SIMILARITY = 0.98
+
+GOLD_QUERIES_PATH = "cache/gold_queries.ndjson"
+
+
+def index_name_for(table_id):
+    return f"table{table_id.replace('-', '_')[1:]}"
+
+
+def clean_column(name):
+    return name[:-1] if name.endswith(".") else name
+
+
+def text_encoder(column):
+    field = f"{column}.keyword"
+
+    def encode(op, value):
+        return {"term": {field: {"value": value, "case_insensitive": True}}}
+    return encode
+
+
+def vector_encoder(column):
+    def encode(op, value):
+        return {"knn": {"field": column, "query_vector": value, "k": KNN_K, "similarity": KNN_SIMILARITY}}
+    return encode
+
+
+def numeric_encoder(column):
+    def encode(op, value):
+        if isinstance(value, str):
+            value = value.replace(',', '.')
+        if op == 0:
+            return {"term": {column: {"value": value}}}
+        if op == 1:
+            return {"range": {column: {"gt": value}}}
+        if op == 2:
+            return {"range": {column: {"lt": value}}}
+        return None  # 'OP' adds no condition
+    return encode
+
+
+ENCODERS = {"text": text_encoder, "dense_vector": vector_encoder}
+
+
+class TableQueryBuilder:
+    __slots__ = ("table_id", "index_name", "columns", "types", "encoders")
+
+    def __init__(self, table_id, headers, types):
+        self.table_id = table_id
+        self.index_name = index_name_for(table_id)
+        self.columns = [clean_column(header) for header in headers]
+        self.types = types
+        self.encoders = [ENCODERS.get(t, numeric_encoder)(column) for column, t in zip(self.columns, types)]
+
+    def build(self, sql):
+        """(agg_info, index name, DSL) of a WikiSQL `sql` dict on this table."""
+        conditions = []
+        for col_index, op_index, value in sql['conds']:
+            clause = self.encoders[col_index](op_index, value)
+            if clause is not None:
+                conditions.append(clause)
+        query = {"query": {"bool": {"must": conditions}}}
+
+        sel = sql['sel']
+        sel_col = self.columns[sel]
+        agg_op = AGG_OPS[sql['agg']]
+        if agg_op:
+            field = f"{sel_col}.keyword" if self.types[sel] == "text" else sel_col
+            query["aggs"] = {f"{agg_op}_{sel_col}": {agg_op: {"field": field}}}
+            query["_source"] = False
+            return True, self.index_name, query
+        query["_source"] = [sel_col]
+        return False, self.index_name, query
+
+
+class GoldCompiler:
+    def __init__(self, headers_csv=HEADERS_CSV, types_csv=TYPES_CSV):
+        self.headers_csv = headers_csv
+        self.types_csv = types_csv
+        self.store = get_store(headers_csv, types_csv)
+        self.builders = {}
+
+    def builder(self, table_id):
+        """Memoized builder of a table, or None when its headers or types are unknown."""
+        try:
+            return self.builders[table_id]
+        except KeyError:
+            pass
+        table = self.store.get(table_id)
+        builder = None
+        if table is None or table.headers is None:
+            print(f"⚠️ Table ID '{table_id}' not found in {self.headers_csv}")
+        elif table.types is None:
+            print(f"⚠️ Table ID '{table_id}' not found in {self.types_csv}")
+        elif table.headers and table.types:
+            builder = TableQueryBuilder(table_id, table.headers, table.types)
+        self.builders[table_id] = builder
+        return builder
+
+    def compile(self, encoded_query):
+        """(agg_info, index name, DSL, question) of a TEST_SET item, or None for an unknown table."""
+        builder = self.builder(encoded_query['table_id'])
+        if builder is None:
+            return None
+        return (*builder.build(encoded_query['sql']), encoded_query['question'])
+
+
+_compilers = {}
+
+def get_compiler(headers_csv=HEADERS_CSV, types_csv=TYPES_CSV):
+    key = (headers_csv, types_csv)
+    if key not in _compilers:
+        _compilers[key] = GoldCompiler(headers_csv, types_csv)
+    return _compilers[key]
+
+
+def compile_dataset(groups, output_path=GOLD_QUERIES_PATH, compiler=None, layout=None):
+    """
+    Write the gold query of every item in `groups` as `_msearch` NDJSON
+    (header + body per search) and the item names to `<output_path>.ids`.
+    Returns (compiled, skipped) counts.
+    """
+    from evaluation_scheduler import TEST_SET_DIR
+
+    compiler = compiler or get_compiler()
+    compiled = skipped = 0
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    with open(output_path, 'w', encoding='utf-8') as out, \
+            open(f"{output_path}.ids", 'w', encoding='utf-8') as ids:
+        for group in groups:
+            with open(f"{TEST_SET_DIR}/{group}_query.jsonl", 'r', encoding='utf-8') as infile:
+                for n, line in enumerate(infile):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    result = compiler.compile(json.loads(line))
+                    if result is None:
+                        skipped += 1
+                        continue
+                    _, index_name, query, _ = result
+                    query = plan_query(query)
+                    header = {"index": index_name}
+                    if layout is not None:
+                        index_name, query, routing = layout.scope(index_name, query)
+                        header = {"index": index_name} if routing is None else {"index": index_name, "routing": routing}
+                    out.write(dumps(header) + "\n" + dumps(query) + "\n")
+                    ids.write(f"{group}/{n}\n")
+                    compiled += 1
+    return compiled, skipped
+
+
+if __name__ == "__main__":
+    import time
+    from evaluation_scheduler import GROUPS
+
+    args = sys.argv[1:]
+    output_path = args.pop(0) if args and args[0].endswith((".ndjson", ".jsonl")) else GOLD_QUERIES_PATH
+    started = time.perf_counter()
+    compiled, skipped = compile_dataset(args or GROUPS, output_path)
+    print(f"✅ Compiled {compiled} gold queries into {output_path} "
+          f"({skipped} skipped) in {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Precomputed gold results for the TEST_SET.
+
+Gold answers only change when the indices change, so they are computed once
+and stored in SQLite keyed by (item id, index version). The item id is a
+hash of the TEST_SET line; the index version is
+`RESULT_FORMAT[:kNN plan]:uuid:docs.count` of the index, so entries stored
+in an older form or under another kNN plan (knn_planner.py) are never
+reused. Results are stored as the JSON of the extracted result list (see
+execute_query.extract_results). The evaluator reads gold results from the
+store and only runs the gold query on a miss.
+
+Precompute the whole TEST_SET with:
+
+    python gold_store.py [group ...]
+"""
+import os
+import sys
+import json
+import sqlite3
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from knn_planner import plan_version
+
+GOLD_STORE_PATH = os.getenv("GOLD_STORE_PATH", "cache/gold_results.sqlite")
+GOLD_CONCURRENCY = int(os.getenv("GOLD_CONCURRENCY", "4"))
+INDEX_PATTERN = "table*"
+RESULT_FORMAT = "extracted-v2"  # v2: shared-layout queries are wrapped, not merged
+
+
+def item_id(encoded_query):
+    return hashlib.sha1(json.dumps(encoded_query, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class GoldStore:
+    def __init__(self, path, es_client, layout=None):
+        self.es = es_client
+        self.layout = layout
+        self._versions = None
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS gold_results ("
+            " item_id TEXT NOT NULL, index_version TEXT NOT NULL, result TEXT NOT NULL,"
+            " PRIMARY KEY (item_id, index_version))"
+        )
+        self._conn.commit()
+
+    def refresh_versions(self):
+        """Read uuid and doc count of every table index in one _cat call."""
+        # Gold results of another kNN plan differ; keep them apart
+        prefix = ":".join(filter(None, (RESULT_FORMAT, plan_version())))
+        rows = self.es.cat.indices(index=INDEX_PATTERN, h="index,uuid,docs.count", format="json").body
+        with self._lock:
+            self._versions = {row["index"]: f"{prefix}:{row['uuid']}:{row['docs.count']}" for row in rows}
+
+    def index_version(self, index_name):
+        if self._versions is None:
+            self.refresh_versions()
+        if self.layout is not None:
+            index_name = self.layout.resolve(index_name)[0]
+        return self._versions.get(index_name)
+
+    def get(self, key, version):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result FROM gold_results WHERE item_id = ? AND index_version = ?", (key, version)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key, version, result):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO gold_results (item_id, index_version, result) VALUES (?, ?, ?)",
+                (key, version, result),
+            )
+            self._conn.commit()
+
+    def lookup_or_run(self, item, run):
+        """Stored gold result of `item`, computing and storing it with `run()` on a miss."""
+        key = item_id(item.encoded_query)
+        # Missing indices have no version; their result is never cached
+        version = self.index_version(item.index_name)
+        if version is not None:
+            result = self.get(key, version)
+            if result is not None:
+                return result
+        result = run()
+        if version is not None:
+            self.put(key, version, result)
+        return result
+
+    async def alookup_or_run(self, item, run):
+        """lookup_or_run() for a coroutine function `run`; versions must be loaded (refresh_versions)."""
+        key = item_id(item.encoded_query)
+        version = self.index_version(item.index_name)
+        if version is not None:
+            # SQLite calls run on a worker thread, off the event loop
+            result = await asyncio.to_thread(self.get, key, version)
+            if result is not None:
+                return result
+        result = await run()
+        if version is not None:
+            await asyncio.to_thread(self.put, key, version, result)
+        return result
+
+
+def open_gold_store(es_client, layout=None, path=GOLD_STORE_PATH):
+    """Open the store configured by GOLD_STORE_PATH, or return None when disabled."""
+    if not path:
+        return None
+    return GoldStore(path, es_client, layout)
+
+
+def precompute(engine, items, workers=GOLD_CONCURRENCY):
+    """Run the gold stage of every item concurrently, filling the engine's gold store."""
+    with ThreadPoolExecutor(workers, thread_name_prefix="gold") as pool:
+        for n, _ in enumerate(pool.map(lambda item: engine.run_stage(item, "gold"), items), 1):
+            if n % 100 == 0:
+                print(f"🏁 {n} / {len(items)} gold results ready")
+    print(f"✅ Gold results ready for {len(items)} items.")
+
+
+if __name__ == "__main__":
+    from pipeline_engine import PipelineEngine
+    from evaluation_scheduler import GROUPS, load_group
+
+    items = []
+    for group in sys.argv[1:] or GROUPS:
+        items.extend(load_group(group))
+    engine = PipelineEngine()
+    if engine.gold_store is None:
+        print("GOLD_STORE_PATH is empty; nothing to precompute.", file=sys.stderr)
+        sys.exit(1)
+    precompute(engine, items)
@@ -0,0 +1,235 @@
+"""
+Shared HTTP clients for CLIP, Ollama and Elasticsearch.
+
+Every backend gets one keep-alive connection pool for the whole process,
+(connect, read) timeouts and retries with exponential backoff on connection
+errors and 429/502/503/504. A circuit breaker per backend fails calls fast
+once BREAKER_THRESHOLD calls in a row have failed, and lets one call through
+again after BREAKER_RESET_S seconds. Health checks are cached for
+HEALTH_CHECK_TTL seconds.
+
+- CLIP:   get_clip_client() (requests session)
+- Ollama: install_llm_session() hands the session to the openai library
+- ES:     get_es_client() (Elasticsearch client with its own retries; its
+          node pool backs off from dead nodes, which serves as the breaker)
+
+The asyncio pipeline (async_pipeline.py) uses the same settings through
+CircuitBreaker.acall() and aretry().
+"""
+import os
+import time
+import asyncio
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from elasticsearch import Elasticsearch
+
+from tracing import annotate
+from vector_serializer import SERIALIZERS
+
+ES_HOST = os.getenv("ELASTIC_HOST", "http://localhost:9200")
+CLIP_HOST = os.getenv("CLIP_HOST", "http://localhost:8000")
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+CLIP_TIMEOUT = float(os.getenv("CLIP_TIMEOUT", "60"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "600"))  # a full generation, not a single token
+ES_TIMEOUT = float(os.getenv("ES_TIMEOUT", "30"))
+
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "0.5"))  # 0.5s, 1s, 2s, ...
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+RETRY_STATUSES = (429, 502, 503, 504)
+
+BREAKER_THRESHOLD = int(os.getenv("BREAKER_THRESHOLD", "5"))
+BREAKER_RESET_S = float(os.getenv("BREAKER_RESET_S", "30"))
+HEALTH_CHECK_TTL = float(os.getenv("HEALTH_CHECK_TTL", "30"))
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, name, threshold=BREAKER_THRESHOLD, reset_after=BREAKER_RESET_S):
+        self.name = name
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.reset_after:
+                raise CircuitOpenError(f"{self.name} is unavailable after {self.failures} failed calls")
+            # Half-open: let this call through; one more failure re-opens
+            self.opened_at = None
+            self.failures = self.threshold - 1
+
+    def record(self, ok):
+        with self._lock:
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.failures >= self.threshold and self.opened_at is None:
+                self.opened_at = time.monotonic()
+                print(f"🔌 Circuit for {self.name} opened after {self.failures} failures")
+
+    def call(self, fn, *args, **kwargs):
+        self.before_call()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record(False)
+            raise
+        self.record(True)
+        return result
+
+    async def acall(self, fn, *args, **kwargs):
+        """call() for a coroutine function."""
+        self.before_call()
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception:
+            self.record(False)
+            raise
+        self.record(True)
+        return result
+
+
+async def aretry(call, retryable, retries=HTTP_RETRIES, backoff=HTTP_BACKOFF):
+    """Await call(), retrying `retryable` errors with the same exponential backoff as make_session()."""
+    for attempt in range(retries + 1):
+        try:
+            return await call()
+        except retryable:
+            if attempt == retries:
+                raise
+            annotate(retries=1)
+            await asyncio.sleep(backoff * 2 ** attempt)
+
+
+class TracedRetry(Retry):
+    """urllib3 Retry that counts every retry on the current trace span."""
+
+    def increment(self, *args, **kwargs):
+        annotate(retries=1)
+        return super().increment(*args, **kwargs)
+
+
+def make_session(retries=HTTP_RETRIES, backoff=HTTP_BACKOFF, pool_size=HTTP_POOL_SIZE):
+    retry = TracedRetry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=RETRY_STATUSES,
+        # Embedding and completion requests are safe to repeat
+        allowed_methods=None,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class ServiceClient:
+    """A base URL with a pooled session, timeouts, a circuit breaker and a cached health check."""
+
+    def __init__(self, name, base_url, read_timeout, health_path="/", session=None):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (HTTP_CONNECT_TIMEOUT, read_timeout)
+        self.health_path = health_path
+        self.session = session or make_session()
+        self.breaker = CircuitBreaker(name)
+        self._healthy_until = 0.0
+
+    def request(self, method, path, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+
+        def send():
+            response = self.session.request(method, f"{self.base_url}{path}", **kwargs)
+            response.raise_for_status()
+            return response
+
+        return self.breaker.call(send)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def healthy(self):
+        """True if the service answered its health check within the last HEALTH_CHECK_TTL seconds."""
+        if time.monotonic() < self._healthy_until:
+            return True
+        try:
+            # One attempt, no retries: callers poll
+            response = requests.get(f"{self.base_url}{self.health_path}", timeout=(HTTP_CONNECT_TIMEOUT, 5))
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        if ok:
+            self._healthy_until = time.monotonic() + HEALTH_CHECK_TTL
+        return ok
+
+    def wait_until_healthy(self, attempts=30, interval=2):
+        if self.healthy():
+            return
+        print(f"⏳ Waiting for {self.name} at {self.base_url}...")
+        for _ in range(attempts - 1):
+            annotate(retries=1)
+            time.sleep(interval)
+            if self.healthy():
+                print(f"✅ {self.name} is ready.")
+                return
+        raise Exception(f"❌ {self.name} is not reachable after {attempts * interval} seconds.")
+
+
+_clients = {}
+_lock = threading.Lock()
+
+def _shared(key, factory):
+    with _lock:
+        if key not in _clients:
+            _clients[key] = factory()
+        return _clients[key]
+
+
+def get_clip_client():
+    return _shared("clip", lambda: ServiceClient("CLIP API", CLIP_HOST, CLIP_TIMEOUT, health_path="/health"))
+
+
+def get_es_service():
+    """Plain HTTP view of ES, used for the cached readiness check."""
+    return _shared("es-http", lambda: ServiceClient("Elasticsearch", ES_HOST, ES_TIMEOUT))
+
+
+def get_es_client():
+    """The process-wide Elasticsearch client."""
+    return _shared("es", lambda: Elasticsearch(
+        ES_HOST,
+        # Injected queries hold float32 vectors; SERIALIZERS writes them out
+        serializers=SERIALIZERS,
+        request_timeout=ES_TIMEOUT,
+        max_retries=HTTP_RETRIES,
+        retry_on_timeout=True,
+        retry_on_status=RETRY_STATUSES,
+        connections_per_node=HTTP_POOL_SIZE,
+    ))
+
+
+llm_breaker = CircuitBreaker("LLM server")
+
+def install_llm_session():
+    """Make the openai library send every request through one pooled, retrying session."""
+    import openai
+    openai.requestssession = _shared("llm", make_session)
@@ -0,0 +1,140 @@
+"""
+Physical index layout of the uploaded tables.
+
+INDEX_LAYOUT selects how the uploader stored the WikiSQL tables:
+
+- per_table: one index per table (`table1_10082596_1`, ...), as before
+- shared:    tables packed into a few `tables_shared_NNN` indices; every
+             document carries a TABLE_ID_FIELD and is routed by table id
+
+In the shared layout the pipeline keeps using the per-table index names
+from the TEST_SET. TableLayout resolves them to the shared index, adds the
+table filter to the query and projects the shared mapping down to the
+table's own fields, so prompts and the DSL stay unchanged.
+
+The registry lives in the `_meta.tables` of each shared index:
+{logical index name: {"table_id": ..., "fields": [...]}}.
+"""
+import os
+import copy
+import threading
+
+INDEX_LAYOUT = os.getenv("INDEX_LAYOUT", "per_table")
+SHARED_INDEX_PATTERN = "tables_shared_*"
+TABLE_ID_FIELD = "table_id"
+
+
+def table_filter(table_id):
+    return {"term": {TABLE_ID_FIELD: table_id}}
+
+
+def scope_knn(knn, table_id):
+    filters = knn.get("filter", [])
+    if isinstance(filters, dict):
+        filters = [filters]
+    return {**knn, "filter": list(filters) + [table_filter(table_id)]}
+
+
+def scope_nested_knn(node, table_id):
+    """Copy of a query tree with the table filter in every knn clause, where it is a pre-filter."""
+    if isinstance(node, list):
+        return [scope_nested_knn(child, table_id) for child in node]
+    if not isinstance(node, dict):
+        return node
+    scoped = {}
+    for key, value in node.items():
+        if key == "knn" and isinstance(value, dict) and "field" in value:
+            scoped[key] = scope_knn(value, table_id)
+        else:
+            scoped[key] = scope_nested_knn(value, table_id)
+    return scoped
+
+
+def scope_query(body, table_id):
+    """Return a copy of a search body restricted to the documents of one table."""
+    scoped = copy.copy(body)
+    knn = body.get("knn")
+    if knn is not None:
+        # Top-level kNN hits are OR-ed with the query's: pre-filter the
+        # candidates, and add no match-all-of-table query
+        scoped["knn"] = [scope_knn(entry, table_id) for entry in knn] if isinstance(knn, list) \
+            else scope_knn(knn, table_id)
+        if "query" not in body:
+            return scoped
+    query = body.get("query")
+    if query is None:
+        scoped["query"] = {"bool": {"filter": [table_filter(table_id)]}}
+    else:
+        # Wrapped rather than merged into the query's own bool: an added filter
+        # would drop minimum_should_match of a should-only bool to 0, and only
+        # a knn clause's own filter keeps its neighbours inside the table
+        scoped["query"] = {"bool": {"must": [scope_nested_knn(query, table_id)],
+                                    "filter": [table_filter(table_id)]}}
+    return scoped
+
+
+class TableLayout:
+    def __init__(self, es_client, layout=INDEX_LAYOUT):
+        self.es = es_client
+        self.shared = layout == "shared"
+        self._tables = None
+        self._lock = threading.Lock()
+
+    def _registry(self):
+        with self._lock:
+            if self._tables is None:
+                self._tables = {}
+                mappings = self.es.indices.get_mapping(index=SHARED_INDEX_PATTERN).body
+                for physical, body in mappings.items():
+                    mapping = body.get("mappings", {})
+                    properties = mapping.get("properties", {})
+                    for logical, entry in mapping.get("_meta", {}).get("tables", {}).items():
+                        self._tables[logical] = (physical, entry["table_id"], {
+                            field: properties[field] for field in entry["fields"] if field in properties
+                        })
+                print(f"📚 Loaded {len(self._tables)} tables from the shared layout.")
+            return self._tables
+
+    def preload(self):
+        """Load the shared registry now instead of on first use."""
+        if self.shared:
+            self._registry()
+
+    def reload(self):
+        with self._lock:
+            self._tables = None
+
+    def resolve(self, index_name):
+        """Return (physical index, table id or None) for a per-table index name."""
+        if not self.shared:
+            return index_name, None
+        entry = self._registry().get(index_name)
+        if entry is None:
+            return index_name, None
+        return entry[0], entry[1]
+
+    def scope(self, index_name, body):
+        """Return (physical index, scoped body, routing) for a search."""
+        physical, table_id = self.resolve(index_name)
+        if table_id is None:
+            return physical, body, None
+        return physical, scope_query(body, table_id), table_id
+
+    def table_mapping(self, index_name):
+        """The table's mapping shaped like a per-table `_mapping` response, or None."""
+        if not self.shared:
+            return None
+        entry = self._registry().get(index_name)
+        if entry is None:
+            return None
+        return {index_name: {"mappings": {"properties": entry[2]}}}
+
+
+_default_layout = None
+
+def get_layout(es_client):
+    """Process-wide layout used by the CLI entry points."""
+    global _default_layout
+    if _default_layout is None:
+        _default_layout = TableLayout(es_client)
+    return _default_layout
@@ -1,34 +1,95 @@
+import re
 import sys
+import json
+from array import array
 
+from vector_serializer import dumps_query
+
+VECTOR_PLACEHOLDER = "$vector$"
+# The placeholder as the LLM writes it, quoted or bare
+_PLACEHOLDER_PATTERN = re.compile(r'"\$vector\$"|(?<![\w"$])\$vector\$(?![\w"$])')
+
+
+class InjectedQuery:
+    """
+    A generated query parsed once, with its embedding in place. `body` is the
+    search body, or None when the LLM response holds no valid JSON; `error`
+    then has the final_result text for it. str() renders the query as text.
+    """
+    __slots__ = ("body", "error")
+
+    def __init__(self, body=None, error=None):
+        self.body = body
+        self.error = error
+
+    def __str__(self):
+        if self.body is None:
+            return self.error
+        return dumps_query(self.body, indent=2)
+
+
+def substitute_vectors(node, vector):
+    """Replace every "$vector$" value (knn query_vector, script params) in place; returns the count."""
+    count = 0
+    items = node.items() if isinstance(node, dict) else enumerate(node) if isinstance(node, list) else ()
+    for key, value in items:
+        if value == VECTOR_PLACEHOLDER:
+            node[key] = vector
+            count += 1
+        elif isinstance(value, (dict, list)):
+            count += substitute_vectors(value, vector)
+    return count
 
-def main(input_file1_path, input_file2_path, output_file_path):
-    # Read input from task_1
-    with open(input_file1_path, 'r') as f:
-        result = f.read().strip()
 
+def parse_query(result, embedding=None):
+    """Parse the DSL part of an LLM response once and inject `embedding` (a float list)."""
+    result = result.strip()
     result = result.replace("```json", "").replace("```", "").strip()
 
+    if "~" in result:
+        result = result.split('~', 1)[0]
+    raw = result.strip()
+    if not raw:
+        return InjectedQuery(error="No JSON found between fences.")
 
-    if "~" not in result:
-        with open(output_file_path, 'w') as f:
-            f.write(str(result))  # Write an empty file
-        return
+    # Without an embedding a bare placeholder stays invalid JSON, as before
+    if embedding is not None:
+        raw = _PLACEHOLDER_PATTERN.sub(json.dumps(VECTOR_PLACEHOLDER), raw)
+    try:
+        body = json.loads(raw)
+    except json.JSONDecodeError as e:
+        print("❌ Invalid JSON:", e)
+        return InjectedQuery(error="Invalid JSON format in input query file.")
+
+    if embedding is not None:
+        substitute_vectors(body, array("f", embedding))
+    return InjectedQuery(body)
 
-    query_template, text = result.split('~', 1)
 
-    with open(input_file2_path, 'r') as f:
-        embedding_str = f.read().strip()
+def inject_embedding(result, embedding_str):
+    """Replace the $vector$ placeholder of an LLM response with the embedding, as text."""
+    embedding_str = embedding_str.strip()
+    embedding = json.loads(embedding_str) if embedding_str else None
+    return str(parse_query(result, embedding))
 
-    query_template_with_vector = query_template.replace('"$vector$"', embedding_str)
-    query_template_with_vector = query_template_with_vector.replace('$vector$', embedding_str)
+
+def main(input_file1_path, input_file2_path, output_file_path):
+    # Read input from task_1
+    with open(input_file1_path, 'r') as f:
+        result = f.read()
+
+    if "~" not in result:
+        embedding_str = ""
+    else:
+        with open(input_file2_path, 'r') as f:
+            embedding_str = f.read()
 
     # Save the result to a file
     with open(output_file_path, 'w') as f:
-        f.write(str(query_template_with_vector))
+        f.write(inject_embedding(result, embedding_str))
 
 if __name__ == "__main__":
     input_file1_path = sys.argv[1]
     input_file2_path = sys.argv[2]
     output_file_path = sys.argv[3]
     main(input_file1_path, input_file2_path, output_file_path)    
-
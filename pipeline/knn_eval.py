@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Recall and latency of kNN search settings against exact scoring.
+
+For every TEST_SET item with a vector condition, the gold query's documents
+are fetched (by id, top k) in several ways:
+
+- exact:   brute force, script_score cosine similarity over the documents
+           matching the other conditions, keeping those above `similarity`
+- bool:    the query as written, knn inside bool.must
+- nc=<n>:  the top-level knn of knn_planner with num_candidates=n
+
+recall@k is |ids ∩ exact ids| / |exact ids| (1 when exact finds nothing and
+neither does the setting); latency is the client wall time of the search.
+Run it against an uploaded cluster (ELASTIC_HOST), e.g. once per
+VECTOR_INDEX_TYPE of the uploader, to pick settings for large tables:
+
+    python knn_eval.py [group ...] [--num-candidates 20,50,100,500] [--limit N] [--repeat 3]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+from gold_compiler import get_compiler
+from knn_planner import top_level_knn
+from index_layout import get_layout
+from http_clients import get_es_client
+from tracing import percentile
+
+KNN_EVAL_OUTPUT = "benchmarks/knn_eval.json"
+TEST_SET_DIR = "data/TEST_SET"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Recall and latency of kNN settings against exact scoring.")
+    parser.add_argument("groups", nargs="*", default=["knn"], help="TEST_SET groups (default: knn)")
+    parser.add_argument("--num-candidates", default="20,50,100,500",
+                        help="comma-separated num_candidates to try (default: 20,50,100,500)")
+    parser.add_argument("--limit", type=int, help="evaluate only the first N vector items")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per item and setting (default: 3)")
+    parser.add_argument("--output", default=KNN_EVAL_OUTPUT, help=f"results JSON (default: {KNN_EVAL_OUTPUT})")
+    return parser.parse_args(argv)
+
+
+def exact_body(knn):
+    """Brute-force equivalent of a top-level knn: cosine over every filtered document."""
+    filters = knn.get("filter", [])
+    script_score = {
+        "query": {"bool": {"filter": filters}} if filters else {"match_all": {}},
+        # +1 keeps scores non-negative, as ES requires
+        "script": {"source": "cosineSimilarity(params.query_vector, params.field) + 1.0",
+                   "params": {"query_vector": knn["query_vector"], "field": knn["field"]}},
+    }
+    if "similarity" in knn:
+        script_score["min_score"] = 1.0 + knn["similarity"]
+    return {"query": {"script_score": script_score}, "size": knn["k"], "_source": False}
+
+
+def eval_items(groups, limit=None):
+    """(name, index name, {setting: body}) of every item whose gold query has a single vector condition."""
+    compiler = get_compiler()
+    items = []
+    for group in groups:
+        with open(f"{TEST_SET_DIR}/{group}_query.jsonl", 'r', encoding='utf-8') as infile:
+            for n, line in enumerate(infile):
+                line = line.strip()
+                if not line:
+                    continue
+                result = compiler.compile(json.loads(line))
+                if result is None:
+                    continue
+                _, index_name, query, _ = result
+                knn = top_level_knn({"query": query["query"], "_source": False}).get("knn")
+                if knn is None:
+                    continue
+                as_written = {"query": query["query"], "size": knn["k"], "_source": False}
+                items.append((f"{group}/{n}", index_name, {"exact": exact_body(knn), "bool": as_written}))
+                if limit and len(items) >= limit:
+                    return items
+    return items
+
+
+def search_ids(es_client, layout, index_name, body):
+    """(ids, wall ms, took ms) of one search."""
+    physical_index, body, routing = layout.scope(index_name, body)
+    started = time.perf_counter()
+    response = es_client.search(index=physical_index, body=body, routing=routing, filter_path="took,hits.hits._id")
+    wall_ms = (time.perf_counter() - started) * 1000
+    return {hit["_id"] for hit in response.get("hits", {}).get("hits", [])}, wall_ms, response.get("took")
+
+
+def evaluate(es_client, layout, items, num_candidates, repeat):
+    """{setting: {items, errors, recall_mean, recall_min, p50_ms, p95_ms, took_p50_ms}}."""
+    recalls, walls, tooks, errors = {}, {}, {}, {}
+    settings = ["exact", "bool"] + [f"nc={n}" for n in num_candidates]
+    for name, index_name, bodies in items:
+        as_written = bodies["bool"]
+        for n in num_candidates:
+            bodies[f"nc={n}"] = top_level_knn(as_written, n)
+        try:
+            exact_ids = search_ids(es_client, layout, index_name, bodies["exact"])[0]
+        except Exception as e:
+            print(f"⚠️ {name}: exact search failed ({e})", file=sys.stderr)
+            continue
+        for setting in settings:
+            try:
+                for _ in range(max(1, repeat)):
+                    ids, wall_ms, took = search_ids(es_client, layout, index_name, bodies[setting])
+                    walls.setdefault(setting, []).append(wall_ms)
+                    if took is not None:
+                        tooks.setdefault(setting, []).append(took)
+            except Exception as e:
+                errors[setting] = errors.get(setting, 0) + 1
+                print(f"⚠️ {name}: {setting} failed ({e})", file=sys.stderr)
+                continue
+            recall = len(ids & exact_ids) / len(exact_ids) if exact_ids else float(not ids)
+            recalls.setdefault(setting, []).append(recall)
+
+    report = {}
+    for setting in settings:
+        if setting not in recalls:
+            continue
+        wall = sorted(walls[setting])
+        took = sorted(tooks.get(setting, []))
+        report[setting] = {
+            "items": len(recalls[setting]),
+            "errors": errors.get(setting, 0),
+            "recall_mean": round(sum(recalls[setting]) / len(recalls[setting]), 4),
+            "recall_min": round(min(recalls[setting]), 4),
+            "p50_ms": round(percentile(wall, 50), 3),
+            "p95_ms": round(percentile(wall, 95), 3),
+            "took_p50_ms": percentile(took, 50) if took else None,
+        }
+    return report
+
+
+def print_report(report):
+    print(f"{'setting':<10} {'items':>6} {'recall':>8} {'min':>6} {'p50 ms':>9} {'p95 ms':>9} {'took':>6}")
+    for setting, stats in report.items():
+        took = "-" if stats["took_p50_ms"] is None else stats["took_p50_ms"]
+        print(f"{setting:<10} {stats['items']:>6} {stats['recall_mean']:>8.3f} {stats['recall_min']:>6.2f} "
+              f"{stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {took:>6}")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    num_candidates = [int(n) for n in args.num_candidates.split(",") if n]
+    items = eval_items(args.groups, args.limit)
+    print(f"🔎 Evaluating {len(items)} vector queries against exact scoring...")
+
+    es_client = get_es_client()
+    report = evaluate(es_client, get_layout(es_client), items, num_candidates, args.repeat)
+    print_report(report)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Results written to {args.output}")
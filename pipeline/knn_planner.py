@@ -0,0 +1,76 @@
+"""
+kNN query planning.
+
+The gold builder and the few-shot prompt put vector searches inside
+bool.must, next to the other conditions:
+
+    {"query": {"bool": {"must": [{"knn": {"field": ..., "query_vector": ..., "k": 20, "similarity": 0.98}},
+                                 {"term": ...}]}}}
+
+With KNN_PLAN=top_level, plan_query() rewrites such a body into an ES 8
+top-level `knn` search. The other clauses of the bool become pre-filters
+(`knn.filter`), so the k nearest documents are searched among the matching
+ones. `num_candidates` (per shard) is KNN_NUM_CANDIDATES, at least k.
+
+Bodies that would change meaning are left as they are, as are all bodies
+with KNN_PLAN=off (default). These are: several knn clauses (top-level knn
+entries are OR-ed), should clauses, a top-level knn already present, or a
+non-bool query. knn_eval.py measures recall and latency of the settings
+against exact scoring.
+"""
+import os
+
+KNN_PLAN = os.getenv("KNN_PLAN", "off")  # off | top_level
+KNN_NUM_CANDIDATES = int(os.getenv("KNN_NUM_CANDIDATES", "100"))
+
+PLANS = ("off", "top_level")
+MAX_NUM_CANDIDATES = 10000  # ES limit
+DEFAULT_SIZE = 10
+
+
+def as_list(clauses):
+    return clauses if isinstance(clauses, list) else [clauses]
+
+
+def top_level_knn(body, num_candidates=KNN_NUM_CANDIDATES):
+    """`body` with its single bool.must knn clause moved to a top-level knn, or `body` unchanged."""
+    query = body.get("query")
+    if "knn" in body or not isinstance(query, dict) or set(query) != {"bool"}:
+        return body
+    bool_query = query["bool"]
+    if not set(bool_query) <= {"must", "filter", "must_not"}:
+        return body
+
+    must = as_list(bool_query.get("must", []))
+    knn_clauses = [clause for clause in must if isinstance(clause, dict) and set(clause) == {"knn"}]
+    if len(knn_clauses) != 1:
+        return body
+
+    knn = dict(knn_clauses[0]["knn"])
+    filters = as_list(knn.pop("filter", []))
+    filters += [clause for clause in must if clause is not knn_clauses[0]]
+    filters += as_list(bool_query.get("filter", []))
+    if bool_query.get("must_not"):
+        filters.append({"bool": {"must_not": as_list(bool_query["must_not"])}})
+
+    k = knn.setdefault("k", body.get("size", DEFAULT_SIZE))
+    knn.setdefault("num_candidates", min(MAX_NUM_CANDIDATES, max(k, num_candidates)))
+    if filters:
+        knn["filter"] = filters
+    planned = {"knn": knn}
+    planned.update((key, value) for key, value in body.items() if key != "query")
+    return planned
+
+
+def plan_query(body, plan=KNN_PLAN, num_candidates=KNN_NUM_CANDIDATES):
+    """The search body to send for `body` under `plan`."""
+    if plan not in PLANS:
+        raise ValueError(f"KNN_PLAN must be one of {PLANS}, got {plan!r}")
+    if plan == "off" or body is None:
+        return body
+    return top_level_knn(body, num_candidates)
+
+
+def plan_version(plan=KNN_PLAN, num_candidates=KNN_NUM_CANDIDATES):
+    """Tag for results that depend on the plan, e.g. stored gold results; empty when off."""
+    return "" if plan == "off" else f"knn-{plan}-{num_candidates}"
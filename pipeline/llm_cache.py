@@ -0,0 +1,113 @@
+"""
+Append-only cache of raw LLM completions.
+
+Each request is keyed on (model, prompt hash, sampling params). Modes
+(LLM_CACHE_MODE):
+
+- off:    always call the LLM, store nothing (default)
+- record: always call the LLM and append the completion to the cache file
+- replay: only serve cached completions; a miss raises LLMCacheMiss
+- auto:   serve cached completions, call and record on a miss
+
+Replaying a recorded run makes downstream stages reproducible and lets them
+be re-evaluated without paying for generation again.
+"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+
+from tracing import annotate
+
+LLM_CACHE_MODE = os.getenv("LLM_CACHE_MODE", "off")
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "cache/llm_responses.jsonl")
+
+MODES = ("off", "record", "replay", "auto")
+
+
+class LLMCacheMiss(Exception):
+    pass
+
+
+def prompt_hash(messages):
+    return hashlib.sha256(json.dumps(messages, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def request_key(model, messages, params):
+    key = {"model": model, "prompt": prompt_hash(messages), "params": params}
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    def __init__(self, path=LLM_CACHE_PATH, mode=LLM_CACHE_MODE):
+        if mode not in MODES:
+            raise ValueError(f"LLM_CACHE_MODE must be one of {MODES}, got {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.entries = {}
+        self._lock = threading.Lock()
+        if mode != "off":
+            self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A run killed mid-write leaves a truncated last line
+                    continue
+                # Later records win, so re-recording overrides older samples
+                self.entries[entry["key"]] = entry["completion"]
+
+    def _append(self, key, model, params, completion):
+        entry = {"key": key, "model": model, "params": params, "completion": completion, "created": time.time()}
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.entries[key] = completion
+
+    def _lookup(self, model, messages, params):
+        """(key, cached completion or None) of a request; raises LLMCacheMiss on a replay miss."""
+        key = request_key(model, messages, params)
+        if self.mode in ("replay", "auto"):
+            with self._lock:
+                cached = self.entries.get(key)
+            if cached is not None:
+                annotate(llm_cache="hit")
+                return key, cached
+            if self.mode == "replay":
+                raise LLMCacheMiss(f"No cached completion for request {key[:12]} in {self.path}")
+        return key, None
+
+    def complete(self, model, messages, params, generate):
+        """Return the completion for this request, calling `generate()` only when the mode allows it."""
+        if self.mode == "off":
+            return generate()
+
+        key, cached = self._lookup(model, messages, params)
+        if cached is not None:
+            return cached
+        completion = generate()
+        self._append(key, model, params, completion)
+        return completion
+
+    async def acomplete(self, model, messages, params, generate):
+        """complete() for a coroutine function `generate`."""
+        if self.mode == "off":
+            return await generate()
+
+        key, cached = self._lookup(model, messages, params)
+        if cached is not None:
+            return cached
+        completion = await generate()
+        await asyncio.to_thread(self._append, key, model, params, completion)
+        return completion
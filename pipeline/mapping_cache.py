@@ -0,0 +1,139 @@
+"""
+Index mapping cache and prompt rendering.
+
+Mappings of every `table*` index are pulled with one bulk `_mapping` call and
+kept for the whole run instead of being fetched per question. Each cached
+index remembers its uuid and mapping_version; those are re-checked in bulk
+at most every MAPPING_CACHE_TTL seconds and entries of changed or deleted
+indices are dropped.
+
+MAPPING_FORMAT selects how a mapping is put into the prompt:
+
+- raw:     Python repr of the `_mapping` response, as the paper runs used
+- compact: one "field: type" line per field, listing keyword subfields
+"""
+import os
+import time
+import threading
+
+MAPPING_FORMAT = os.getenv("MAPPING_FORMAT", "raw")
+MAPPING_CACHE_TTL = float(os.getenv("MAPPING_CACHE_TTL", "300"))
+INDEX_PATTERN = "table*"
+
+
+def describe_field(name, spec):
+    field_type = spec.get("type", "object")
+    details = []
+    if field_type == "dense_vector" and "dims" in spec:
+        details.append(f"dims {spec['dims']}")
+    for sub_name, sub_spec in spec.get("fields", {}).items():
+        details.append(f"{sub_spec.get('type', 'object')} subfield: {name}.{sub_name}")
+    line = f"- {name}: {field_type}"
+    if details:
+        line += f" ({'; '.join(details)})"
+    return line
+
+
+def render_compact_mapping(mapping):
+    """Render a `_mapping` response as field: type lines."""
+    blocks = []
+    for index_name, body in mapping.items():
+        lines = [f"Index: {index_name}", "Fields:"]
+        for name, spec in body.get("mappings", {}).get("properties", {}).items():
+            lines.append(describe_field(name, spec))
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks)
+
+
+def render_mapping(mapping, mapping_format=MAPPING_FORMAT):
+    if mapping_format == "compact":
+        return render_compact_mapping(mapping)
+    return str(mapping)
+
+
+class MappingCache:
+    def __init__(self, es_client, pattern=INDEX_PATTERN, mapping_format=MAPPING_FORMAT, ttl=MAPPING_CACHE_TTL,
+                 layout=None):
+        self.es = es_client
+        self.layout = layout
+        self.pattern = pattern
+        self.mapping_format = mapping_format
+        self.ttl = ttl
+        self._mappings = {}
+        self._versions = {}
+        self._checked_at = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def _index_versions(self, index):
+        state = self.es.cluster.state(
+            metric="metadata",
+            index=index,
+            filter_path="metadata.indices.*.settings.index.uuid,metadata.indices.*.mapping_version",
+        )
+        indices = state.get("metadata", {}).get("indices", {})
+        return {
+            name: (meta["settings"]["index"]["uuid"], meta.get("mapping_version"))
+            for name, meta in indices.items()
+        }
+
+    def preload(self):
+        """Fetch the mappings of every index matching the pattern in one call."""
+        mappings = self.es.indices.get_mapping(index=self.pattern).body
+        versions = self._index_versions(self.pattern)
+        with self._lock:
+            for index_name, body in mappings.items():
+                self._mappings[index_name] = {index_name: body}
+            self._versions.update(versions)
+            self._checked_at = time.monotonic()
+        print(f"📚 Cached mappings of {len(mappings)} indices.")
+
+    def refresh_changed(self):
+        """Drop cached mappings whose index was recreated, remapped or deleted."""
+        versions = self._index_versions(self.pattern)
+        with self._lock:
+            for index_name in list(self._mappings):
+                current = versions.get(index_name)
+                if index_name in self._versions and current != self._versions[index_name]:
+                    del self._mappings[index_name]
+                    if current is None:
+                        del self._versions[index_name]
+                    else:
+                        self._versions[index_name] = current
+            self._checked_at = time.monotonic()
+
+    def invalidate(self, index_name=None):
+        with self._lock:
+            if index_name is None:
+                self._mappings.clear()
+                self._versions.clear()
+                self._checked_at = None
+            else:
+                self._mappings.pop(index_name, None)
+                self._versions.pop(index_name, None)
+
+    def get(self, index_name):
+        """Return the `_mapping` response body for `index_name`."""
+        if self.layout is not None and self.layout.shared:
+            # Tables packed into shared indices: project the table's own fields
+            mapping = self.layout.table_mapping(index_name)
+            if mapping is not None:
+                return mapping
+
+        with self._refresh_lock:
+            if self._checked_at is None:
+                self.preload()
+            elif time.monotonic() - self._checked_at > self.ttl:
+                self.refresh_changed()
+
+        with self._lock:
+            mapping = self._mappings.get(index_name)
+        if mapping is None:
+            # Not covered by the pattern (e.g. an alias) or dropped as stale
+            mapping = self.es.indices.get_mapping(index=index_name).body
+            with self._lock:
+                self._mappings[index_name] = mapping
+        return mapping
+
+    def render(self, index_name):
+        return render_mapping(self.get(index_name), self.mapping_format)
@@ -0,0 +1,149 @@
+"""
+Batched query execution through `_msearch`.
+
+MsearchBatcher is a drop-in for `es_client.search(...)` used by the
+execution and gold stages, including the gold_store.py precompute:
+concurrent callers are grouped for up to ES_BATCH_WAIT_MS (or ES_BATCH_SIZE
+searches) into one `_msearch`. Per-item errors are raised as the same
+elasticsearch exceptions a single search would raise (BadRequestError for
+400, ApiError otherwise), so execute_query classifies them exactly as
+before. Raise ES_CONCURRENCY / GOLD_CONCURRENCY well above the batch size
+to keep batches full.
+"""
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from elastic_transport import ApiResponseMeta, HttpHeaders, NodeConfig, ObjectApiResponse
+from elasticsearch import exceptions
+from elasticsearch.exceptions import HTTP_EXCEPTIONS
+
+ES_BATCH_SIZE = int(os.getenv("ES_BATCH_SIZE", "0"))  # 0 or 1: one search per request
+ES_BATCH_WAIT_MS = float(os.getenv("ES_BATCH_WAIT_MS", "10"))
+MSEARCH_CONCURRENCY = int(os.getenv("MSEARCH_CONCURRENCY", "2"))
+
+
+def item_error(item, meta=None):
+    """Build the exception a single search would have raised for an `_msearch` error item."""
+    status = item.get("status", 500)
+    error = item.get("error", {})
+    message = error.get("type", "error") if isinstance(error, dict) else str(error)
+    if meta is None:
+        meta = ApiResponseMeta(status=status, http_version="1.1", headers=HttpHeaders(),
+                               duration=0.0, node=NodeConfig("http", "localhost", 9200))
+    error_class = HTTP_EXCEPTIONS.get(status, exceptions.ApiError)
+    return error_class(message=message, meta=meta, body=item)
+
+
+def _search_lines(batch):
+    searches = []
+    for index, body, routing, _ in batch:
+        header = {"index": index}
+        if routing is not None:
+            header["routing"] = routing
+        searches.extend([header, body])
+    return searches
+
+
+def _batch_filter_path(batch):
+    """The filter_path every search of the batch asked for, applied to each response, or None."""
+    filter_paths = {filter_path for _, _, _, filter_path in batch}
+    if len(filter_paths) != 1 or None in filter_paths:
+        return None
+    paths = [f"responses.{path}" for path in filter_paths.pop().split(",")]
+    return ",".join(paths + ["responses.error", "responses.status"])
+
+
+def run_msearch(es_client, batch):
+    """
+    One `_msearch` for `batch` of (index, body, routing, filter_path) searches;
+    returns a response or an exception per search.
+    """
+    try:
+        response = es_client.msearch(searches=_search_lines(batch), filter_path=_batch_filter_path(batch))
+    except Exception as e:
+        return [e] * len(batch)
+    results = []
+    for item in response["responses"]:
+        if "error" in item:
+            results.append(item_error(item))
+        else:
+            results.append(ObjectApiResponse(body=item, meta=response.meta))
+    return results
+
+
+class MsearchBatcher:
+    def __init__(self, es_client, batch_size=ES_BATCH_SIZE, max_wait_ms=ES_BATCH_WAIT_MS,
+                 concurrency=MSEARCH_CONCURRENCY):
+        self.es = es_client
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._pool = ThreadPoolExecutor(concurrency, thread_name_prefix="msearch")
+        self._thread = threading.Thread(target=self._run, name="msearch-batcher", daemon=True)
+        self._thread.start()
+
+    # Pass-through for the API the stages use besides search()
+    def __getattr__(self, name):
+        return getattr(self.es, name)
+
+    def submit(self, index, body, routing=None, filter_path=None):
+        future = Future()
+        self._queue.put(((index, body, routing, filter_path), future))
+        return future
+
+    def search(self, index, body, routing=None, filter_path=None):
+        return self.submit(index, body, routing, filter_path).result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        if batch[0] is None:
+            return None
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if entry is None:
+                self._queue.put(None)
+                break
+            batch.append(entry)
+        return batch
+
+    def _send(self, batch):
+        results = run_msearch(self.es, [search for search, _ in batch])
+        for (_, future), result in zip(batch, results):
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            self._pool.submit(self._send, batch)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._pool.shutdown(wait=True)
+
+
+def unwrap(searcher):
+    """The Elasticsearch client behind a searcher, for calls that cannot be batched."""
+    return searcher.es if isinstance(searcher, MsearchBatcher) else searcher
+
+
+def make_searcher(es_client, batch_size=ES_BATCH_SIZE):
+    """The client itself, or an MsearchBatcher around it when ES_BATCH_SIZE > 1."""
+    if batch_size > 1:
+        return MsearchBatcher(es_client, batch_size)
+    return es_client
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+In-process pipeline engine.
+
+Runs the six pipeline stages as plain function calls over one shared
+Elasticsearch client and keeps every intermediate result in memory.
+Writing the intermediate files under `outputs/` is an optional debug dump.
+"""
+import json
+from pathlib import Path
+
+from export_index_mapping import wait_for_elasticsearch, create_es_connection
+from mapping_cache import MappingCache
+from index_layout import TableLayout
+from gold_store import open_gold_store
+from msearch import make_searcher
+from tracing import Tracer, trace_span, output_size
+from generate_query_from_nlq import get_response
+from generate_embedding import embed_llm_response
+from inject_embedding_into_query import parse_query
+from execute_query import execute, format_results
+from run_correct_query import correct_results
+
+STAGES = ("mapping", "generate", "embed", "inject", "execute", "gold")
+
+# Debug dump file for each stage, named as in the old subprocess chain
+DUMP_FILES = {
+    "mapping": "mapping.txt",
+    "generate": "llm_response.txt",
+    "embed": "embedding.txt",
+    "inject": "query.txt",
+    "execute": "final_result.txt",
+    "gold": "correct_result.txt",
+}
+
+# Outputs each stage reads from earlier stages
+STAGE_INPUTS = {
+    "mapping": (),
+    "generate": ("mapping",),
+    "embed": ("generate",),
+    "inject": ("generate", "embed"),
+    "execute": ("inject",),
+    "gold": (),
+}
+
+
+def downstream_stages(stage):
+    """`stage` and every stage reading its output, directly or not, in run order."""
+    affected = {stage}
+    for name in STAGES:
+        if any(source in affected for source in STAGE_INPUTS[name]):
+            affected.add(name)
+    return tuple(name for name in STAGES if name in affected)
+
+
+class PipelineStageError(Exception):
+    def __init__(self, stage, error):
+        super().__init__(f"{stage}: {error}")
+        self.stage = stage
+        self.error = error
+
+
+class PipelineItem:
+    """Working state of one NLQ as it moves through the stages."""
+
+    def __init__(self, index_name, nlq, encoded_query, dump_dir=None, group=None, name=None):
+        self.index_name = index_name
+        self.nlq = nlq
+        self.encoded_query = encoded_query
+        self.dump_dir = Path(dump_dir) if dump_dir else None
+        self.group = group
+        # "<group>/<line>" for TEST_SET items; used by traces and PROFILE_ITEM
+        self.name = name
+        self.outputs = {}
+        # Extracted results of the execute and gold stages, for compare_results
+        self.results = {}
+
+    @property
+    def final_result(self):
+        return self.outputs.get("execute")
+
+    @property
+    def correct_result(self):
+        return self.outputs.get("gold")
+
+
+def store_output(item, stage, output):
+    """Keep a stage output on the item and dump it when the item has a dump dir."""
+    item.outputs[stage] = output
+    if item.dump_dir is not None:
+        item.dump_dir.mkdir(parents=True, exist_ok=True)
+        text = '' if output is None else str(output)
+        (item.dump_dir / DUMP_FILES[stage]).write_text(text, encoding="utf-8")
+
+
+class PipelineEngine:
+    def __init__(self, es_client=None, gold_store=True, tracer=None):
+        # Per-stage spans when TRACE_PATH or PROFILE_ITEM is set; see tracing.py
+        self.tracer = tracer if tracer is not None else Tracer.from_env()
+        if es_client is None:
+            with trace_span(self.tracer, None, "startup"):
+                wait_for_elasticsearch()
+                es_client = create_es_connection()
+        self.es = es_client
+        # Generated and gold queries go through _msearch when ES_BATCH_SIZE > 1
+        self.searcher = make_searcher(es_client)
+        self.layout = TableLayout(es_client)
+        self.mappings = MappingCache(es_client, layout=self.layout)
+        # Precomputed gold results keyed by (item, index version); see gold_store.py
+        self.gold_store = open_gold_store(es_client, self.layout) if gold_store else None
+
+    # --- Stages ---
+
+    def mapping(self, item):
+        return self.mappings.render(item.index_name)
+
+    def generate(self, item):
+        return get_response(item.outputs["mapping"].strip(), item.nlq)
+
+    def embed(self, item):
+        return embed_llm_response(item.outputs["generate"])
+
+    def inject(self, item):
+        # Parsed once; the vector is only written out when the request is encoded
+        return parse_query(item.outputs["generate"], item.outputs["embed"])
+
+    def execute(self, item):
+        text, results = execute(self.searcher, item.index_name, item.outputs["inject"], self.layout)
+        item.results["execute"] = results
+        return text
+
+    def gold(self, item):
+        def run():
+            return json.dumps(correct_results(item.encoded_query, self.searcher, self.layout))
+
+        stored = run() if self.gold_store is None else self.gold_store.lookup_or_run(item, run)
+        results = json.loads(stored)
+        item.results["gold"] = results
+        if results is None:
+            return "Table ID not found."
+        return format_results(results)
+
+    # --- Driving ---
+
+    def run_stage(self, item, stage):
+        with trace_span(self.tracer, item, stage) as span:
+            try:
+                output = getattr(self, stage)(item)
+            except Exception as e:
+                raise PipelineStageError(stage, e) from e
+            if span is not None:
+                span["bytes"] = output_size(output)
+        store_output(item, stage, output)
+        return output
+
+    def run(self, item, stages=STAGES):
+        for stage in stages:
+            self.run_stage(item, stage)
+        return item
+
+
+def item_from_json(data, dump_dir=None, group=None, name=None):
+    """Build a PipelineItem from one TEST_SET line."""
+    table_id = data["table_id"]
+    index_name = f"table{table_id.replace('-', '_')[1:]}"
+    return PipelineItem(index_name, data["question"], data, dump_dir, group, name)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 2:
+        print("Usage: python pipeline_engine.py <query_json_string>", file=sys.stderr)
+        sys.exit(1)
+
+    item = item_from_json(json.loads(sys.argv[1]), dump_dir="outputs")
+    PipelineEngine().run(item)
+    print(item.final_result)
@@ -1,23 +1,23 @@
 #!/usr/bin/env python3
 import json
-import pandas as pd
-from elasticsearch import Elasticsearch
-import os
-import ast
 import sys
 from pathlib import Path
+from index_layout import get_layout
+from gold_compiler import AGG_OPS, COND_OPS, get_compiler
+from execute_query import RESULT_FILTER_PATH, extract_results, prepare_search
+from http_clients import get_es_client
+from knn_planner import plan_query
 
-# Elasticsearch connection
-ES_HOST = os.getenv("ELASTIC_HOST", "http://localhost:9200")
-es = Elasticsearch(ES_HOST)
+# Shared client for ELASTIC_HOST (default localhost:9200)
+es = get_es_client()
 
 # Relative CSV paths inside Docker
 TYPES_FILE = "inputs/types.csv"
 MASTER_CSV = "inputs/headers.csv"
 
 class Query:
-    agg_ops = ['', 'max', 'min', 'value_count', 'sum', 'avg']
-    cond_ops = ['=', '>', '<', 'OP']
+    agg_ops = AGG_OPS
+    cond_ops = COND_OPS
     agg_ops_sql = ['', 'MAX', 'MIN', 'COUNT', 'SUM', 'AVG']
 
     def __init__(self, sel_column, agg_index, conditions=tuple()):
@@ -37,112 +37,43 @@ class Query:
             ])
         return rep
 
-def load_table_by_id(master_csv, types_file, table_id):
-    master_df = pd.read_csv(master_csv)
-    types_df = pd.read_csv(types_file)
-
-    table_row = master_df[master_df['Table ID'].str.strip() == table_id.strip()]
-    if table_row.empty:
-        print(f"⚠️ Table ID '{table_id}' not found in {master_csv}")
-        return None, None
-
-    type_row = types_df[types_df['Table ID'].str.strip() == table_id.strip()]
-    if type_row.empty:
-        print(f"⚠️ Table ID '{table_id}' not found in {types_file}")
-        return None, None
-
-    columns = table_row.iloc[0]['Headers'].split(';')
-    types = type_row.iloc[0]['Types'].split(';')
-    return [c.strip() for c in columns], [t.strip() for t in types]
-
 def convert_to_elasticsearch_dsl(encoded_query, master_csv):
-    table_id = encoded_query['table_id']
-    question = encoded_query['question']
-    sql = encoded_query['sql']
-    agg_info = False
-    index_name = f"table{table_id.replace('-', '_')[1:]}"
-    columns, types = load_table_by_id(master_csv, TYPES_FILE, table_id)
-
-    if not columns or not types:
-        return None
-
-    sel_col = columns[sql['sel']]
-    sel_col_type = types[sql['sel']]
-    agg_op = Query.agg_ops[sql['agg']]
-    conditions = []
-
-    for cond in sql['conds']:
-        col_index, op_index, value = cond
-        col_name = columns[col_index]
-        operator = Query.cond_ops[op_index]
-        col_type = types[col_index]
-
-        if col_name.endswith("."):
-            col_name = col_name[:-1]
-
-        if col_type == 'text':
-            conditions.append({
-                "term": {f"{col_name}.keyword": {"value": value, "case_insensitive": True}}
-            })
-        elif col_type == 'dense_vector':
-            conditions.append({
-                "knn": {
-                    "field": col_name,
-                    "query_vector": value,
-                    "k": 20,
-                    "similarity": 0.98
-                }
-            })
-        else:
-            if isinstance(value, str):
-                value = value.replace(',', '.')
-            if operator == '=':
-                conditions.append({"term": {col_name: {"value": value}}})
-            elif operator == '>':
-                conditions.append({"range": {col_name: {"gt": value}}})
-            elif operator == '<':
-                conditions.append({"range": {col_name: {"lt": value}}})
-
-    query = {
-        "query": {
-            "bool": {
-                "must": conditions
-            }
-        }
-    }
-
-    if sel_col.endswith("."):
-        sel_col = sel_col[:-1]
+    """(agg_info, index_name, query, question), built by the memoized per-table compiler."""
+    return get_compiler(master_csv, TYPES_FILE).compile(encoded_query)
 
-    if agg_op:
-        field = f"{sel_col}.keyword" if sel_col_type == "text" else sel_col
-        query["aggs"] = {
-            f"{agg_op}_{sel_col}": {
-                agg_op: {"field": field}
-            }
-        }
-        query["_source"] = False
-        agg_info = True
-    else:
-        query["_source"] = [sel_col]
-
-    return agg_info, index_name, query, question
-
-def get_response(result):
+def get_response(result, es_client=None, layout=None, filter_path=None):
     agg_info, index_name, dsl_query, question = result
-    return es.search(index=index_name, body=dsl_query)
+    es_client = es_client or es
+    # Shared layout: search the shared index, scoped to this table
+    layout = layout or get_layout(es_client)
+    physical_index, dsl_query, routing = layout.scope(index_name, plan_query(dsl_query))
+    if filter_path is not None:
+        dsl_query = prepare_search(dsl_query)
+    return es_client.search(index=physical_index, body=dsl_query, routing=routing, filter_path=filter_path)
+
+def run_correct(encoded_query, es_client=None, layout=None):
+    """Build and execute the gold query of a TEST_SET item, returning the correct_result text."""
+    result = convert_to_elasticsearch_dsl(encoded_query, MASTER_CSV)
+    if result is None:
+        return "Table ID not found."
 
-def main(encoded_query_str, output_file_path):
-    encoded_query = json.loads(encoded_query_str)
-    Path(output_file_path).parent.mkdir(parents=True, exist_ok=True)
+    response = get_response(result, es_client, layout)
+    # "took" differs on every run; drop it so gold results are reproducible
+    body = {key: value for key, value in response.body.items() if key != "took"}
+    return json.dumps(body, indent=2)
 
+def correct_results(encoded_query, es_client=None, layout=None):
+    """Gold results in the same extracted form execute_query produces, or None if the table is unknown."""
     result = convert_to_elasticsearch_dsl(encoded_query, MASTER_CSV)
     if result is None:
-        Path(output_file_path).write_text("Table ID not found.")
-        return
+        return None
+    # Only what extraction reads; run_correct keeps dumping the full response
+    return extract_results(get_response(result, es_client, layout, RESULT_FILTER_PATH))
 
-    response = get_response(result)
-    Path(output_file_path).write_text(json.dumps(response, indent=2))
+def main(encoded_query_str, output_file_path):
+    encoded_query = json.loads(encoded_query_str)
+    Path(output_file_path).parent.mkdir(parents=True, exist_ok=True)
+    Path(output_file_path).write_text(run_correct(encoded_query))
 
 # CLI mode for subprocess.run(...)
 if __name__ == "__main__":
@@ -0,0 +1,136 @@
+"""
+Durable per-item state of an evaluation run.
+
+Every stage output is written to SQLite (RUN_STORE_PATH) as soon as the
+stage finishes, together with the item's status: `done` (compared, with its
+score) or `failed` (stage and error). Restarting a run over the same store
+skips done items and resumes failed or interrupted ones from their last
+stored stage, so an LLM or ES hiccup only costs the stages that did not
+complete.
+
+Items are keyed by `<group>/<line>`; a stored item whose TEST_SET line has
+changed since is ignored.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+
+from gold_store import item_id
+from inject_embedding_into_query import InjectedQuery
+from vector_serializer import dumps_query
+
+RUN_STORE_PATH = os.getenv("RUN_STORE_PATH", "")
+
+
+def encode_output(stage, output):
+    """Text form of a stage output; decode_output() reverses it."""
+    if stage == "embed":
+        return json.dumps(None if output is None else list(output))
+    if stage == "inject":
+        if output.body is None:
+            return json.dumps({"error": output.error})
+        return '{"body":' + dumps_query(output.body) + '}'
+    return output
+
+
+def decode_output(stage, text):
+    if stage == "embed":
+        return json.loads(text)
+    if stage == "inject":
+        data = json.loads(text)
+        return InjectedQuery(data.get("body"), data.get("error"))
+    return text
+
+
+class RunStore:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            " name TEXT PRIMARY KEY, query_hash TEXT NOT NULL, item_group TEXT,"
+            " status TEXT NOT NULL, correct INTEGER, failed_stage TEXT, error TEXT, updated REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS stage_outputs ("
+            " name TEXT NOT NULL, stage TEXT NOT NULL, output TEXT NOT NULL, results TEXT,"
+            " PRIMARY KEY (name, stage))"
+        )
+        self._conn.commit()
+
+    def _write(self, sql, params):
+        with self._lock:
+            self._conn.execute(sql, params)
+            self._conn.commit()
+
+    def _set_status(self, item, status, correct=None, stage=None, error=None):
+        self._write(
+            "INSERT OR REPLACE INTO items (name, query_hash, item_group, status, correct, failed_stage, error, updated)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (item.name, item_id(item.encoded_query), item.group, status, correct, stage, error, time.time()),
+        )
+
+    def save_stage(self, item, stage):
+        results = item.results.get(stage) if stage in ("execute", "gold") else None
+        self._write(
+            "INSERT OR REPLACE INTO stage_outputs (name, stage, output, results) VALUES (?, ?, ?, ?)",
+            (item.name, stage, encode_output(stage, item.outputs[stage]),
+             None if results is None else json.dumps(results)),
+        )
+
+    def drop_stages(self, item, stages):
+        """Forget the stored outputs of `stages`, e.g. before they are recomputed."""
+        with self._lock:
+            self._conn.executemany("DELETE FROM stage_outputs WHERE name = ? AND stage = ?",
+                                   [(item.name, stage) for stage in stages])
+            self._conn.commit()
+
+    def finish(self, item, correct):
+        self._set_status(item, "done", correct=correct)
+
+    def fail(self, item, stage, error):
+        self._set_status(item, "failed", stage=stage, error=str(error))
+
+    def start(self, item):
+        self._set_status(item, "running")
+
+    def restore(self, item):
+        """
+        Load the stored outputs of `item` into it and return (status, correct).
+        Returns (None, None), dropping any leftovers, when nothing valid is stored.
+        """
+        query_hash = item_id(item.encoded_query)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT query_hash, status, correct FROM items WHERE name = ?", (item.name,)
+            ).fetchone()
+            if row is None or row[0] != query_hash:
+                self._conn.execute("DELETE FROM stage_outputs WHERE name = ?", (item.name,))
+                self._conn.commit()
+                return None, None
+            stages = self._conn.execute(
+                "SELECT stage, output, results FROM stage_outputs WHERE name = ?", (item.name,)
+            ).fetchall()
+        for stage, output, results in stages:
+            item.outputs[stage] = decode_output(stage, output)
+            if results is not None:
+                item.results[stage] = json.loads(results)
+        return row[1], row[2]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM items")
+            self._conn.execute("DELETE FROM stage_outputs")
+            self._conn.commit()
+
+
+def open_run_store(path=RUN_STORE_PATH):
+    """Open the store at `path`, or return None when it is empty (no run store)."""
+    if not path:
+        return None
+    return RunStore(path)
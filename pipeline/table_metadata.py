@@ -0,0 +1,105 @@
+"""
+Table metadata (headers and column types) keyed by WikiSQL table id.
+
+inputs/headers.csv and inputs/types.csv are parsed once into a dict of
+TableMeta records. The parsed store is pickled to TABLE_METADATA_CACHE and
+reused as long as both CSV files are unchanged (size and mtime), so later
+processes start without parsing the CSVs or importing pandas.
+"""
+import os
+import csv
+import pickle
+import threading
+
+HEADERS_CSV = "inputs/headers.csv"
+TYPES_CSV = "inputs/types.csv"
+TABLE_METADATA_CACHE = os.getenv("TABLE_METADATA_CACHE", "cache/table_metadata.pickle")
+
+
+class TableMeta:
+    __slots__ = ("table_id", "headers", "types")
+
+    def __init__(self, table_id, headers=None, types=None):
+        self.table_id = table_id
+        self.headers = headers
+        self.types = types
+
+    def __getstate__(self):
+        return (self.table_id, self.headers, self.types)
+
+    def __setstate__(self, state):
+        self.table_id, self.headers, self.types = state
+
+    def __repr__(self):
+        return f"TableMeta({self.table_id!r}, headers={self.headers!r}, types={self.types!r})"
+
+
+def read_column(path, column):
+    """Map stripped `Table ID` to the stripped, ';'-split `column` values (first row wins)."""
+    values = {}
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            table_id = (row.get("Table ID") or "").strip()
+            if table_id and table_id not in values and row.get(column) is not None:
+                values[table_id] = [value.strip() for value in row[column].split(';')]
+    return values
+
+
+def source_signature(*paths):
+    return tuple((path, os.stat(path).st_size, os.stat(path).st_mtime_ns) for path in paths)
+
+
+class TableMetadataStore:
+    def __init__(self, tables, signature=None):
+        self.tables = tables
+        self.signature = signature
+
+    def get(self, table_id):
+        return self.tables.get(table_id.strip())
+
+    def __len__(self):
+        return len(self.tables)
+
+    @classmethod
+    def from_csv(cls, headers_csv=HEADERS_CSV, types_csv=TYPES_CSV):
+        headers = read_column(headers_csv, "Headers")
+        types = read_column(types_csv, "Types")
+        tables = {
+            table_id: TableMeta(table_id, headers.get(table_id), types.get(table_id))
+            for table_id in headers.keys() | types.keys()
+        }
+        return cls(tables, source_signature(headers_csv, types_csv))
+
+    @classmethod
+    def load(cls, headers_csv=HEADERS_CSV, types_csv=TYPES_CSV, cache_path=TABLE_METADATA_CACHE):
+        """Load from the pickle cache when it matches the CSVs, else parse and rebuild it."""
+        signature = source_signature(headers_csv, types_csv)
+        if cache_path and os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'rb') as f:
+                    store = pickle.load(f)
+                if isinstance(store, cls) and store.signature == signature:
+                    return store
+            except Exception as e:
+                print(f"[warn] Ignoring unreadable table metadata cache {cache_path}: {e}")
+
+        store = cls.from_csv(headers_csv, types_csv)
+        if cache_path:
+            os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(store, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        return store
+
+
+_stores = {}
+_lock = threading.Lock()
+
+def get_store(headers_csv=HEADERS_CSV, types_csv=TYPES_CSV):
+    """Process-wide store for a pair of CSV files."""
+    key = (headers_csv, types_csv)
+    with _lock:
+        if key not in _stores:
+            _stores[key] = TableMetadataStore.load(headers_csv, types_csv)
+        return _stores[key]
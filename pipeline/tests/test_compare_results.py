@@ -0,0 +1,43 @@
+from compare_results import compare_results
+
+
+def test_numbers_straddling_a_rounding_boundary_match():
+    assert compare_results([0.12345678949], [0.12345678951]) == 1
+
+
+def test_int_and_float_match_and_distant_numbers_do_not():
+    assert compare_results([3, [{"key": 1, "doc_count": 2}]], [3.0, [{"key": 1.0, "doc_count": 2}]]) == 1
+    assert compare_results([0.1234], [0.1235]) == 0
+
+
+def test_order_does_not_matter_but_multiplicity_does():
+    gold = [{"a": "x", "b": 1.5}, {"a": "y", "b": 2}]
+    assert compare_results(gold, list(reversed(gold))) == 1
+    assert compare_results(gold, gold + gold[:1]) == 0
+
+
+def test_buckets_ignore_formatting():
+    gold = [[{"key": "a", "doc_count": 1}, {"key": "b", "doc_count": 2}]]
+    predicted = [[{"key": "b", "doc_count": 2, "key_as_string": "B"}, {"key": "a", "doc_count": 1}]]
+    assert compare_results(gold, predicted) == 1
+
+
+def test_failed_queries_never_match():
+    assert compare_results(None, None) == 0
+    assert compare_results([], None) == 0
+
+
+def test_compound_values_pair_with_the_right_partner():
+    gold = [{"a": 1.0000000001, "b": "x"}, {"a": 1.0, "b": "y"}]
+    predicted = [{"a": 1.0, "b": "x"}, {"a": 1.0000000001, "b": "y"}]
+    assert compare_results(gold, predicted) == 1
+    assert compare_results(gold, [{"a": 1.0, "b": "x"}, {"a": 1.0, "b": "z"}]) == 0
+
+
+def test_ints_compare_exactly():
+    assert compare_results([2**60 + 1], [2**60]) == 0
+    assert compare_results([2**60], [2**60]) == 1
+
+
+def test_bools_are_not_numbers():
+    assert compare_results([True], [1]) == 0
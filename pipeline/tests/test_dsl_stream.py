@@ -0,0 +1,57 @@
+import pytest
+
+from dsl_stream import DslStreamParser
+
+DSL = '{"query": {"bool": {"must": [{"match": {"Name": "a}{b \\"c\\""}}]}}}'
+
+
+def stream(text, size):
+    """Feed `text` in chunks of `size`; returns (answer complete before the end, parsed text)."""
+    parser = DslStreamParser()
+    for start in range(0, len(text), size):
+        if parser.feed(text[start:start + size]):
+            return True, parser.text()
+    return False, parser.finish()
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1000])
+def test_fenced_dsl_and_tail_inside_think_noise(size):
+    text = ("<think>maybe {\"query\": 1} ~ no</think>\n```json\n" + DSL +
+            "\n~ Eiffel Tower\n```\nThis query finds the rows.")
+    stopped, parsed = stream(text, size)
+    assert stopped
+    assert parsed == DSL + "\n~ Eiffel Tower"
+
+
+@pytest.mark.parametrize("size", [1, 4, 1000])
+def test_braces_and_escaped_quotes_in_strings_do_not_end_the_object(size):
+    stopped, parsed = stream(DSL + "\nThe end.", size)
+    assert stopped
+    assert parsed == DSL
+
+
+@pytest.mark.parametrize("size", [1, 5, 1000])
+def test_unquoted_tail_ends_at_a_blank_line(size):
+    stopped, parsed = stream(DSL + " ~ tower in\nParis\n\nExplanation follows", size)
+    assert stopped
+    assert parsed == DSL + " ~ tower in\nParis"
+
+
+@pytest.mark.parametrize("size", [1, 5, 1000])
+def test_quoted_tail_ends_at_its_closing_quote(size):
+    stopped, parsed = stream(DSL + '\n~ "tower \\" in Paris"\nExplanation', size)
+    assert stopped
+    assert parsed == DSL + '\n~ "tower \\" in Paris"'
+
+
+def test_think_marker_split_across_chunks():
+    parser = DslStreamParser()
+    for chunk in ["<thi", "nk>{\"a\": 1}</th", "ink>", '{"b": ', "2}"]:
+        parser.feed(chunk)
+    assert parser.finish() == '{"b": 2}'
+
+
+def test_incomplete_stream_is_flushed_by_finish():
+    parser = DslStreamParser()
+    assert not parser.feed('```json\n{"query": {"match_all": {}')
+    assert parser.finish() == '{"query": {"match_all": {}'
@@ -0,0 +1,59 @@
+from evaluation_scheduler import EvaluationScheduler
+from pipeline_engine import PipelineItem, store_output
+from run_store import RunStore
+from inject_embedding_into_query import InjectedQuery
+
+
+class FakeEngine:
+    """Stages whose outputs record which generation they were computed from."""
+
+    tracer = None
+
+    def __init__(self, generation):
+        self.generation = generation
+        self.calls = []
+
+    def run_stage(self, item, stage):
+        self.calls.append(stage)
+        if stage == "embed":
+            output = None
+        elif stage == "inject":
+            output = InjectedQuery({"generation": self.generation}, None)
+        else:
+            output = f"{stage}-{self.generation}"
+        if stage == "execute":
+            item.results["execute"] = [item.outputs["generate"]]
+        elif stage == "gold":
+            item.results["gold"] = ["generate-new"]
+        store_output(item, stage, output)
+        return output
+
+
+def make_item():
+    return PipelineItem("table1_1", "nlq", {"table_id": "1-1", "question": "nlq"}, group="agg", name="agg/0")
+
+
+def test_rerun_of_generate_recomputes_downstream_stages(tmp_path):
+    store = RunStore(str(tmp_path / "run.sqlite"))
+    EvaluationScheduler(FakeEngine("old"), store=store).evaluate([make_item()])
+
+    engine = FakeEngine("new")
+    scheduler = EvaluationScheduler(engine, store=store)
+    results = scheduler.rerun_stage([make_item()], "generate")
+
+    assert engine.calls == ["generate", "embed", "inject", "execute"]
+    # Scored against the execution of the new generation
+    assert results == {"agg": (1, 1)}
+    item = make_item()
+    assert store.restore(item) == ("done", 1)
+    assert item.outputs["inject"].body == {"generation": "new"}
+    assert item.results["execute"] == ["generate-new"]
+
+
+def test_rerun_of_execute_keeps_earlier_stages(tmp_path):
+    store = RunStore(str(tmp_path / "run.sqlite"))
+    EvaluationScheduler(FakeEngine("old"), store=store).evaluate([make_item()])
+
+    engine = FakeEngine("new")
+    EvaluationScheduler(engine, store=store).rerun_stage([make_item()], "execute")
+    assert engine.calls == ["execute"]
@@ -0,0 +1,41 @@
+from execute_query import iter_hits
+
+DOCS = [{"name": f"doc{n}", "score": (n * 7) % 10} for n in range(25)]
+
+
+def sort_key(doc_id, clause):
+    (field, order), = clause.items()
+    if isinstance(order, dict):
+        order = order.get("order", "asc")
+    value = {"_score": DOCS[doc_id]["score"], "_shard_doc": doc_id}[field]
+    return -value if order == "desc" else value
+
+
+class FakeES:
+    """One shard of DOCS, sorted by _score and _shard_doc only; a doc's score is its `score` field."""
+
+    def open_point_in_time(self, index, keep_alive, routing=None):
+        return {"id": "pit"}
+
+    def close_point_in_time(self, id):
+        pass
+
+    def search(self, body, index=None, routing=None, filter_path=None):
+        sort = body.get("sort") or [{"_score": "desc"}, {"_shard_doc": "asc"}]
+        keyed = sorted((tuple(sort_key(n, clause) for clause in sort), n) for n in range(len(DOCS)))
+        if "search_after" in body:
+            after = [-value if "desc" in str(clause) else value for value, clause in zip(body["search_after"], sort)]
+            keyed = [(key, n) for key, n in keyed if list(key) > after]
+        hits = []
+        for key, n in keyed[:body["size"]]:
+            values = [-value if "desc" in str(clause) else value for value, clause in zip(key, sort)]
+            hits.append({"_source": {"name": DOCS[n]["name"]}, "sort": values})
+        return {"pit_id": "pit", "hits": {"hits": hits}}
+
+
+def test_paged_hits_match_a_one_shot_scored_search():
+    body = {"query": {"match": {"name": "doc"}}, "size": 12}
+    one_shot = FakeES().search(index="t", body=body)["hits"]["hits"]
+    paged = list(iter_hits(FakeES(), "t", body, page_size=5))
+    assert [hit["_source"] for hit in paged] == [hit["_source"] for hit in one_shot]
+
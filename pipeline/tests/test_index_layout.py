@@ -0,0 +1,33 @@
+from index_layout import scope_query, table_filter
+
+TABLE = "1-10082596-1"
+KNN = {"field": "Location", "query_vector": [0.1, 0.2], "k": 20, "similarity": 0.98}
+
+
+def test_should_only_bool_keeps_its_should_semantics():
+    query = {"bool": {"should": [{"term": {"a": 1}}, {"term": {"b": 2}}]}}
+    scoped = scope_query({"query": query}, TABLE)["query"]
+    # The original bool is untouched inside must, so one should clause must still match
+    assert scoped == {"bool": {"must": [query], "filter": [table_filter(TABLE)]}}
+
+
+def test_knn_in_bool_must_is_pre_filtered_by_table():
+    query = {"bool": {"must": [{"knn": KNN}, {"term": {"a": 1}}]}}
+    scoped = scope_query({"query": query, "size": 20}, TABLE)
+    inner = scoped["query"]["bool"]["must"][0]["bool"]["must"]
+    assert inner[0]["knn"]["filter"] == [table_filter(TABLE)]
+    assert inner[1] == {"term": {"a": 1}}
+    assert scoped["query"]["bool"]["filter"] == [table_filter(TABLE)]
+    assert scoped["size"] == 20
+    # The input body is not modified
+    assert "filter" not in KNN
+
+
+def test_top_level_knn_gets_table_pre_filter_and_no_query():
+    scoped = scope_query({"knn": {**KNN, "filter": {"term": {"a": 1}}}}, TABLE)
+    assert scoped["knn"]["filter"] == [{"term": {"a": 1}}, table_filter(TABLE)]
+    assert "query" not in scoped
+
+
+def test_missing_query_matches_the_table():
+    assert scope_query({"size": 0}, TABLE)["query"] == {"bool": {"filter": [table_filter(TABLE)]}}
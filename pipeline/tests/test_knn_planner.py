@@ -0,0 +1,61 @@
+import pytest
+
+from knn_planner import MAX_NUM_CANDIDATES, plan_query, plan_version, top_level_knn
+
+KNN = {"field": "Location", "query_vector": [0.1, 0.2], "k": 20, "similarity": 0.98}
+
+
+def test_single_knn_in_must_becomes_top_level():
+    body = {"query": {"bool": {"must": [{"knn": KNN}]}}, "_source": False}
+    planned = top_level_knn(body, 50)
+    assert planned == {"knn": {**KNN, "num_candidates": 50}, "_source": False}
+    assert "num_candidates" not in KNN
+
+
+def test_other_clauses_become_pre_filters():
+    body = {
+        "query": {"bool": {
+            "must": [{"term": {"a": 1}}, {"knn": {**KNN, "filter": {"term": {"c": 3}}}}],
+            "filter": {"bool": {"should": [{"term": {"d": 4}}, {"term": {"e": 5}}]}},
+            "must_not": {"term": {"b": 2}},
+        }},
+        "aggs": {"n": {"value_count": {"field": "a"}}},
+    }
+    knn = top_level_knn(body, 10)["knn"]
+    assert knn["filter"] == [
+        {"term": {"c": 3}},
+        {"term": {"a": 1}},
+        {"bool": {"should": [{"term": {"d": 4}}, {"term": {"e": 5}}]}},
+        {"bool": {"must_not": [{"term": {"b": 2}}]}},
+    ]
+    # num_candidates is never below k
+    assert knn["k"] == 20 and knn["num_candidates"] == 20
+    assert top_level_knn(body, 10)["aggs"] == body["aggs"]
+
+
+def test_k_comes_from_size_and_num_candidates_is_capped():
+    knn = {key: value for key, value in KNN.items() if key != "k"}
+    planned = top_level_knn({"query": {"bool": {"must": {"knn": knn}}}, "size": 5}, 10 ** 6)
+    assert planned["knn"]["k"] == 5
+    assert planned["knn"]["num_candidates"] == MAX_NUM_CANDIDATES
+    assert planned["size"] == 5
+
+
+@pytest.mark.parametrize("query", [
+    {"bool": {"must": [{"knn": KNN}, {"knn": KNN}]}},
+    {"bool": {"must": [{"knn": KNN}], "should": [{"term": {"a": 1}}]}},
+    {"bool": {"must": [{"term": {"a": 1}}]}},
+    {"knn": KNN},
+])
+def test_bodies_that_would_change_meaning_are_kept(query):
+    body = {"query": query}
+    assert top_level_knn(body) is body
+
+
+def test_plan_off_keeps_the_body_and_version():
+    body = {"query": {"bool": {"must": [{"knn": KNN}]}}}
+    assert plan_query(body, "off") is body
+    assert "knn" in plan_query(body, "top_level")
+    assert plan_version("off") == "" and plan_version("top_level", 100) == "knn-top_level-100"
+    with pytest.raises(ValueError):
+        plan_query(body, "nested")
@@ -0,0 +1,206 @@
+"""
+Per-stage tracing and profiling of pipeline runs.
+
+With TRACE_PATH set (e.g. `traces/run.jsonl`), every stage of every item is
+recorded as one JSON line: item, group, stage, wall time, output bytes,
+LLM token counts, retries and status. At the end of a run a summary with
+p50/p95/p99 wall times per stage and group is printed and written next to
+the trace (`<TRACE_PATH>.summary.json`).
+
+Code running inside a stage adds to its span with annotate(), e.g.
+`annotate(completion_tokens=n)`; numeric fields are summed, others set.
+
+PROFILE_ITEM=<group>/<line> (e.g. `knn/3`) profiles every stage of that
+one TEST_SET item with PROFILER (`cprofile`, default, or `pyinstrument`)
+into PROFILE_DIR.
+"""
+import os
+import json
+import time
+import threading
+import contextvars
+from array import array
+from contextlib import contextmanager, nullcontext
+
+TRACE_PATH = os.getenv("TRACE_PATH", "")
+PROFILE_ITEM = os.getenv("PROFILE_ITEM", "")
+PROFILER = os.getenv("PROFILER", "cprofile")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+PERCENTILES = (50, 95, 99)
+
+# Per thread and per asyncio task, so concurrent items never share a span
+_current_span = contextvars.ContextVar("span", default=None)
+
+
+def annotate(**fields):
+    """Add fields to the span running on this thread or task; a no-op when tracing is off."""
+    span = _current_span.get()
+    if span is None:
+        return
+    for key, value in fields.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            span[key] = span.get(key, 0) + value
+        else:
+            span[key] = value
+
+
+def output_size(output):
+    """Size in bytes of a stage output, as far as it can be told without re-encoding it."""
+    if isinstance(output, str):
+        return len(output.encode("utf-8"))
+    if isinstance(output, array):
+        return output.itemsize * len(output)
+    if isinstance(output, list):
+        return 4 * len(output)  # float32 embedding
+    return None
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    rank = max(0, min(len(sorted_values) - 1, -(-len(sorted_values) * p // 100) - 1))
+    return sorted_values[int(rank)]
+
+
+def summarize(spans):
+    """{stage: {group: {count, errors, mean_ms, p50_ms, p95_ms, p99_ms, total_ms, ...}}}; group "all" covers every group."""
+    samples = {}
+    for span in spans:
+        span_groups = (span["group"], "all") if span.get("group") else ("all",)
+        for group in span_groups:
+            samples.setdefault(span["stage"], {}).setdefault(group, []).append(span)
+
+    summary = {}
+    for stage, groups in samples.items():
+        summary[stage] = {}
+        # Groups in name order, "all" last
+        for group in sorted(groups, key=lambda name: (name == "all", name)):
+            group_spans = groups[group]
+            wall = sorted(span["wall_ms"] for span in group_spans)
+            stats = {
+                "count": len(wall),
+                "errors": sum(span["status"] != "ok" for span in group_spans),
+                "mean_ms": round(sum(wall) / len(wall), 3),
+                "total_ms": round(sum(wall), 3),
+            }
+            for p in PERCENTILES:
+                stats[f"p{p}_ms"] = round(percentile(wall, p), 3)
+            for key in ("bytes", "prompt_tokens", "completion_tokens", "retries"):
+                total = sum(span.get(key) or 0 for span in group_spans)
+                if total:
+                    stats[key] = total
+            summary[stage][group] = stats
+    return summary
+
+
+class Tracer:
+    def __init__(self, path=TRACE_PATH, profile_item=PROFILE_ITEM, profiler=PROFILER, profile_dir=PROFILE_DIR):
+        self.path = path
+        self.profile_item = profile_item
+        self.profiler = profiler
+        self.profile_dir = profile_dir
+        self.spans = []
+        self._lock = threading.Lock()
+        self._file = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._file = open(path, 'w', encoding='utf-8')
+
+    @classmethod
+    def from_env(cls):
+        """A Tracer when TRACE_PATH or PROFILE_ITEM is set, else None."""
+        if not TRACE_PATH and not PROFILE_ITEM:
+            return None
+        return cls()
+
+    @contextmanager
+    def span(self, item, stage):
+        """Time one stage of `item` (None for run-level spans such as startup)."""
+        span = {
+            "item": getattr(item, "name", None),
+            "group": getattr(item, "group", None),
+            "stage": stage,
+            "start": time.time(),
+            "status": "ok",
+        }
+        token = _current_span.set(span)
+        started = time.perf_counter()
+        try:
+            with self._profiled(item, stage):
+                yield span
+        except BaseException as e:
+            span["status"] = "error"
+            span["error"] = f"{type(e).__name__}: {e}"[:500]
+            raise
+        finally:
+            span["wall_ms"] = round((time.perf_counter() - started) * 1000, 3)
+            _current_span.reset(token)
+            self._record(span)
+
+    def _profiled(self, item, stage):
+        name = getattr(item, "name", None)
+        if not self.profile_item or name != self.profile_item:
+            return nullcontext()
+        return self._profile(f"{name.replace('/', '_')}_{stage}")
+
+    @contextmanager
+    def _profile(self, name):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        if self.profiler == "pyinstrument":
+            from pyinstrument import Profiler
+            profiler = Profiler()
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                with open(os.path.join(self.profile_dir, f"{name}.html"), 'w', encoding='utf-8') as f:
+                    f.write(profiler.output_html())
+        else:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                profiler.dump_stats(os.path.join(self.profile_dir, f"{name}.prof"))
+        print(f"🔬 Profile of {name} written to {self.profile_dir}/")
+
+    def _record(self, span):
+        with self._lock:
+            self.spans.append(span)
+            if self._file is not None:
+                self._file.write(json.dumps(span, ensure_ascii=False) + "\n")
+
+    def summary(self):
+        with self._lock:
+            return summarize(list(self.spans))
+
+    def print_summary(self, summary=None):
+        summary = summary or self.summary()
+        print(f"{'stage':<10} {'group':<6} {'count':>6} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'total s':>9}")
+        for stage, groups in summary.items():
+            for group, stats in groups.items():
+                print(f"{stage:<10} {group:<6} {stats['count']:>6} {stats['p50_ms']:>10.1f} "
+                      f"{stats['p95_ms']:>10.1f} {stats['p99_ms']:>10.1f} {stats['total_ms'] / 1000:>9.2f}")
+
+    def close(self):
+        """Flush the trace and write, then print, the summary."""
+        summary = self.summary()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            with open(f"{self.path}.summary.json", 'w', encoding='utf-8') as f:
+                json.dump(summary, f, indent=2)
+            print(f"🧭 Trace written to {self.path} (summary: {self.path}.summary.json)")
+        if summary:
+            self.print_summary(summary)
+        return summary
+
+
+def trace_span(tracer, item, stage):
+    """tracer.span(item, stage), or a no-op context when tracing is off."""
+    if tracer is None:
+        return nullcontext(None)
+    return tracer.span(item, stage)
@@ -0,0 +1,59 @@
+"""
+Request serializers that write float32 query vectors straight into the body.
+
+Injected queries carry their embedding as an `array('f')`. The stock
+serializer cannot encode it; these serializers write each vector once, as
+'%.9g' numbers (enough to round-trip a float32), while the request body is
+encoded. Pass SERIALIZERS to every client that sends generated queries:
+
+    Elasticsearch(ES_HOST, serializers=SERIALIZERS)
+"""
+import re
+import json
+from array import array
+
+from elastic_transport import JsonSerializer, NdjsonSerializer
+
+# Stand-in written by json.dumps for a vector; "\x00" is escaped as \u0000
+_VECTOR_TOKEN = "\x00vector"
+_VECTOR_PATTERN = re.compile(r'"\\u0000vector(\d+)"')
+
+
+def format_vector(vector):
+    return "[" + ",".join(map("{:.9g}".format, vector)) + "]"
+
+
+def dumps_query(body, default=None, indent=None):
+    """JSON text of a search body, writing any array('f') as a plain number list."""
+    vectors = []
+
+    def encode(value):
+        if isinstance(value, array):
+            vectors.append(value)
+            return f"{_VECTOR_TOKEN}{len(vectors) - 1}"
+        if default is None:
+            raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+        return default(value)
+
+    separators = (",", ":") if indent is None else None
+    text = json.dumps(body, default=encode, ensure_ascii=False, indent=indent, separators=separators)
+    if vectors:
+        text = _VECTOR_PATTERN.sub(lambda match: format_vector(vectors[int(match.group(1))]), text)
+    return text
+
+
+class VectorJsonSerializer(JsonSerializer):
+    def json_dumps(self, data):
+        return dumps_query(data, default=self.default).encode("utf-8", "surrogatepass")
+
+
+class VectorNdjsonSerializer(NdjsonSerializer):
+    # _msearch bodies: every line goes through json_dumps
+    def json_dumps(self, data):
+        return dumps_query(data, default=self.default).encode("utf-8", "surrogatepass")
+
+
+SERIALIZERS = {
+    VectorJsonSerializer.mimetype: VectorJsonSerializer(),
+    VectorNdjsonSerializer.mimetype: VectorNdjsonSerializer(),
+}
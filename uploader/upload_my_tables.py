@@ -3,40 +3,85 @@ import json
 import time
 import requests
 import re
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from elasticsearch import Elasticsearch, helpers
 
+try:
+    # Shipped from pipeline/ by the uploader image; optional when run standalone
+    from table_metadata import get_store
+except ImportError:
+    get_store = None
+
 # --- Environment Config ---
 ES_HOST = os.getenv("ELASTIC_HOST", "http://localhost:9200")
+CLIP_HOST = os.getenv("CLIP_HOST", "http://localhost:8000")
 JSONL_FILE = "tables.jsonl"  # Ensure this file is present in the same directory
 
+# --- Bulk load config ---
+UPLOAD_MODE = os.getenv("UPLOAD_MODE", "parallel")  # parallel | serial
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "2000"))
+CREATE_BATCH_SIZE = int(os.getenv("CREATE_BATCH_SIZE", "200"))
+RESTORE_REPLICAS = int(os.getenv("RESTORE_REPLICAS", "1"))
+
+# --- Vector columns ---
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+EMBED_MEMO_SIZE = int(os.getenv("EMBED_MEMO_SIZE", "50000"))
+VECTOR_DIMS = 512
+# hnsw builds a float32 HNSW graph so kNN queries use approximate search;
+# int8_hnsw / int4_hnsw quantize the vectors in the graph (4x / 8x less
+# memory); flat / int8_flat / int4_flat scan without a graph
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "hnsw")
+VECTOR_HNSW_M = int(os.getenv("VECTOR_HNSW_M", "16"))
+VECTOR_EF_CONSTRUCTION = int(os.getenv("VECTOR_EF_CONSTRUCTION", "100"))
+VECTOR_INDEX_TYPES = ("hnsw", "int8_hnsw", "int4_hnsw", "flat", "int8_flat", "int4_flat")
+if VECTOR_INDEX_TYPE not in VECTOR_INDEX_TYPES:
+    raise ValueError(f"VECTOR_INDEX_TYPE must be one of {VECTOR_INDEX_TYPES}, got {VECTOR_INDEX_TYPE!r}")
+VECTOR_INDEX_OPTIONS = {"type": VECTOR_INDEX_TYPE}
+if VECTOR_INDEX_TYPE.endswith("hnsw"):
+    VECTOR_INDEX_OPTIONS.update(m=VECTOR_HNSW_M, ef_construction=VECTOR_EF_CONSTRUCTION)
+
+# --- Index layout (must match pipeline/index_layout.py) ---
+INDEX_LAYOUT = os.getenv("INDEX_LAYOUT", "per_table")  # per_table | shared
+SHARED_INDEX_PREFIX = "tables_shared_"
+TABLE_ID_FIELD = "table_id"
+SHARED_MAX_FIELDS = int(os.getenv("SHARED_MAX_FIELDS", "900"))
+SHARED_SHARDS = int(os.getenv("SHARED_SHARDS", "1"))
+
+# Settings applied while loading, restored once every table is in
+LOAD_SETTINGS = {"refresh_interval": "-1", "number_of_replicas": 0}
+# Index names per put_settings call, to keep the URL short
+SETTINGS_BATCH_SIZE = 100
+
 # --- Wait for Elasticsearch to be ready ---
-for _ in range(30):
-    try:
-        res = requests.get(ES_HOST)
-        if res.status_code == 200:
-            print("✅ Elasticsearch is up.")
-            break
-    except:
-        pass
-    print("⏳ Waiting for Elasticsearch...")
-    time.sleep(2)
-else:
+def wait_for_elasticsearch():
+    for _ in range(30):
+        try:
+            res = requests.get(ES_HOST)
+            if res.status_code == 200:
+                print("✅ Elasticsearch is up.")
+                return
+        except:
+            pass
+        print("⏳ Waiting for Elasticsearch...")
+        time.sleep(2)
     raise Exception("❌ Elasticsearch not reachable.")
 
 # --- Set cluster setting (no auth required in unsecured mode) ---
-print("⚙️ Setting max_shards_per_node...")
-requests.put(
-    f"{ES_HOST}/_cluster/settings",
-    headers={"Content-Type": "application/json"},
-    json={"persistent": {"cluster.max_shards_per_node": 10000}}
-)
-
-# --- Initialize Elasticsearch client ---
-es = Elasticsearch(ES_HOST)
+def set_max_shards_per_node():
+    print("⚙️ Setting max_shards_per_node...")
+    requests.put(
+        f"{ES_HOST}/_cluster/settings",
+        headers={"Content-Type": "application/json"},
+        json={"persistent": {"cluster.max_shards_per_node": 10000}}
+    )
 
 # --- Define helper functions ---
 
-def create_index_with_mapping(es_client, index_name, headers, types):
+def build_properties(headers, types):
     properties = {}
 
     for header, t in zip(headers, types):
@@ -52,28 +97,39 @@ def create_index_with_mapping(es_client, index_name, headers, types):
                 }
             }
         elif t == "dense_vector":
-            field_mapping = {"type": "dense_vector", "dims": 512}
+            field_mapping = {
+                "type": "dense_vector",
+                "dims": VECTOR_DIMS,
+                "index": True,
+                "similarity": "cosine",
+                "index_options": VECTOR_INDEX_OPTIONS
+            }
         else:  # Numeric or real
             field_mapping = {"type": "double"}
 
         properties[header] = field_mapping
 
-    mapping = {
-        "settings": {"index.mapping.ignore_malformed": True},
+    return properties
+
+def build_index_body(headers, types, settings=None):
+    return {
+        "settings": {"index.mapping.ignore_malformed": True, **(settings or {})},
         "mappings": {
             "dynamic": "strict",
-            "properties": properties
+            "properties": build_properties(headers, types)
         }
     }
 
+def create_index_with_mapping(es_client, index_name, headers, types):
+    mapping = build_index_body(headers, types)
+
     if es_client.indices.exists(index=index_name):
         print(f"ℹ️ Index {index_name} already exists.")
     else:
         es_client.indices.create(index=index_name, body=mapping)
         print(f"✅ Created index: {index_name}")
 
-def upload_table_to_index(es_client, index_name, headers, rows, types):
-    actions = []
+def table_actions(index_name, headers, rows, types, table_id=None):
     for row in rows:
         doc = {}
         for i, (header, t) in enumerate(zip(headers, types)):
@@ -84,28 +140,327 @@ def upload_table_to_index(es_client, index_name, headers, rows, types):
                 value = value.replace(',', '.')
             doc[header] = value
 
-        actions.append({
+        action = {
             "_index": index_name,
             "_source": doc
-        })
+        }
+        if table_id is not None:
+            # Shared layout: tag and route every row by its table
+            doc[TABLE_ID_FIELD] = table_id
+            action["_routing"] = table_id
+        yield action
 
+def upload_table_to_index(es_client, index_name, headers, rows, types):
     try:
-        success, failed = helpers.bulk(es_client, actions, raise_on_error=False)
+        success, failed = helpers.bulk(
+            es_client, table_actions(index_name, headers, rows, types),
+            chunk_size=BULK_CHUNK_SIZE, raise_on_error=False
+        )
         print(f"📦 Uploaded {success} docs to {index_name}. Failed: {len(failed)}")
         if failed:
-            print("❗ Some documents failed:", failed)
+            print("❗ Some documents failed:", failed[:10])
+        return success, len(failed)
     except Exception as e:
         print(f"❌ Bulk upload error: {e}")
+        # Counted as failed, like the errors parallel_bulk reports per document
+        return 0, len(rows)
+
+# --- Embedding of dense_vector columns ---
+
+class TextEmbedder:
+    """
+    Embeds the source texts of dense_vector columns through the CLIP API.
+
+    Texts are gathered across rows and tables, deduplicated, looked up in a
+    bounded in-memory memo and sent to /embed/batch in chunks of
+    EMBED_BATCH_SIZE. The CLIP API consults its persistent cache as well.
+    """
+
+    def __init__(self, host=CLIP_HOST, batch_size=EMBED_BATCH_SIZE, memo_size=EMBED_MEMO_SIZE):
+        self.host = host
+        self.batch_size = batch_size
+        self.memo_size = memo_size
+        self.memo = OrderedDict()
+        # Keep-alive session; retries with backoff while CLIP restarts or is busy
+        self.session = requests.Session()
+        retry = Retry(total=5, backoff_factor=1, status_forcelist=(429, 502, 503, 504), allowed_methods=None)
+        self.session.mount("http://", HTTPAdapter(max_retries=retry))
+        self.embedded = 0
+
+    def embed_many(self, texts):
+        missing = [text for text in dict.fromkeys(texts) if text not in self.memo]
+        for start in range(0, len(missing), self.batch_size):
+            chunk = missing[start:start + self.batch_size]
+            response = self.session.post(f"{self.host}/embed/batch", json={"texts": chunk}, timeout=300)
+            response.raise_for_status()
+            for text, vector in zip(chunk, response.json()["embeddings"]):
+                self.memo[text] = vector
+            self.embedded += len(chunk)
+        vectors = {}
+        for text in texts:
+            self.memo.move_to_end(text)
+            vectors[text] = self.memo[text]
+        while len(self.memo) > self.memo_size:
+            self.memo.popitem(last=False)
+        return vectors
+
+    def embed_tables(self, tables):
+        """Replace the text cells of dense_vector columns with their vectors, in place."""
+        cells = []
+        for table in tables:
+            columns = [i for i, t in enumerate(table["types"]) if t == "dense_vector"]
+            for row in table["rows"] if columns else ():
+                for i in columns:
+                    if i < len(row) and isinstance(row[i], str) and row[i]:
+                        cells.append((row, i))
+        if not cells:
+            return
+        vectors = self.embed_many([row[i] for row, i in cells])
+        for row, i in cells:
+            row[i] = vectors[row[i]]
+
+def load_table_metadata():
+    """Column types from inputs/headers.csv + types.csv, or None when unavailable."""
+    if get_store is None:
+        return None
+    try:
+        return get_store()
+    except FileNotFoundError:
+        return None
+
+def iter_tables(path, metadata=None):
+    """Stream tables from the JSONL file one line at a time."""
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            data = json.loads(line.strip())
+            if 'header' in data and 'id' in data:
+                data["index_name"] = f"table{data['id'].replace('-', '_')[1:]}"
+                if "types" not in data and metadata is not None:
+                    # Plain WikiSQL lines carry no types; use the benchmark's types.csv
+                    table = metadata.get(data["id"])
+                    if table is not None and table.types is not None:
+                        data["types"] = table.types
+                if "types" not in data:
+                    print(f"⚠️ No column types for table {data['id']}; skipping.")
+                    continue
+                yield data
+
+def iter_batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# --- Shared layout ---
+
+class SharedLayoutPacker:
+    """
+    Packs tables into a few shared indices instead of one index per table.
+
+    A table goes into the first shared index whose existing fields do not
+    conflict with its own (same name, different mapping) and which stays
+    under SHARED_MAX_FIELDS; otherwise a new shared index is created. The
+    table registry is kept in the `_meta.tables` of each shared index, which
+    is what the pipeline reads to resolve per-table index names.
+    """
+
+    def __init__(self, es_client, max_fields=SHARED_MAX_FIELDS):
+        self.es = es_client
+        self.max_fields = max_fields
+        self.indices = {}
+        self.created = []
+        mappings = self.es.indices.get_mapping(index=f"{SHARED_INDEX_PREFIX}*").body
+        for name in sorted(mappings):
+            mapping = mappings[name].get("mappings", {})
+            self.indices[name] = {
+                "properties": mapping.get("properties", {}),
+                "tables": mapping.get("_meta", {}).get("tables", {}),
+            }
+
+    @staticmethod
+    def field_count(properties):
+        # Subfields (e.g. .keyword) count towards index.mapping.total_fields.limit
+        return sum(1 + len(spec.get("fields", {})) for spec in properties.values())
+
+    @staticmethod
+    def field_signature(spec):
+        # ES adds defaults to returned mappings, so compare types only
+        return spec.get("type"), sorted((name, sub.get("type")) for name, sub in spec.get("fields", {}).items())
+
+    def _fits(self, shared, properties):
+        for name, spec in properties.items():
+            existing = shared["properties"].get(name)
+            if existing is not None and self.field_signature(existing) != self.field_signature(spec):
+                return False
+        new_fields = {name: spec for name, spec in properties.items() if name not in shared["properties"]}
+        return self.field_count(shared["properties"]) + self.field_count(new_fields) <= self.max_fields
+
+    def _new_index(self):
+        name = f"{SHARED_INDEX_PREFIX}{len(self.indices):03d}"
+        self.es.indices.create(index=name, body={
+            "settings": {
+                "index.mapping.ignore_malformed": True,
+                "index.mapping.total_fields.limit": self.max_fields + 100,
+                "number_of_shards": SHARED_SHARDS,
+                **LOAD_SETTINGS,
+            },
+            "mappings": {
+                "dynamic": "strict",
+                "properties": {TABLE_ID_FIELD: {"type": "keyword"}},
+                "_meta": {"tables": {}},
+            },
+        })
+        self.indices[name] = {"properties": {TABLE_ID_FIELD: {"type": "keyword"}}, "tables": {}}
+        self.created.append(name)
+        print(f"✅ Created shared index: {name}")
+        return name
+
+    def assign(self, tables):
+        """Set table["shared_index"] for a batch of tables and update the touched mappings once."""
+        touched = set()
+        for table in tables:
+            properties = build_properties(table["header"], table["types"])
+            target = next((name for name, shared in self.indices.items()
+                           if table["index_name"] in shared["tables"]), None)
+            if target is None:
+                target = next((name for name, shared in self.indices.items()
+                               if self._fits(shared, properties)), None) or self._new_index()
+            shared = self.indices[target]
+            shared["properties"].update(properties)
+            shared["tables"][table["index_name"]] = {"table_id": table["id"], "fields": list(properties)}
+            table["shared_index"] = target
+            touched.add(target)
+
+        for name in sorted(touched):
+            shared = self.indices[name]
+            self.es.indices.put_mapping(
+                index=name, properties=shared["properties"], meta={"tables": shared["tables"]}
+            )
+
+# --- Parallel load ---
+
+class ParallelLoader:
+    """
+    Streams bulk actions for every table through helpers.parallel_bulk.
+
+    Tables are read in batches of CREATE_BATCH_SIZE; the missing indices of
+    a batch are created concurrently (with refresh and replicas off) just
+    before the batch's documents are yielded. Settings are restored once the
+    load is done.
+    """
+
+    def __init__(self, es_client, workers=UPLOAD_WORKERS, chunk_size=BULK_CHUNK_SIZE,
+                 create_batch_size=CREATE_BATCH_SIZE):
+        self.es = es_client
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.create_batch_size = create_batch_size
+        self.shared = SharedLayoutPacker(es_client) if INDEX_LAYOUT == "shared" else None
+        self.existing = set() if self.shared else set(self.es.indices.get_alias(index="table*").body)
+        self.created = []
+        self.embedder = TextEmbedder()
+
+    def _create(self, table):
+        body = build_index_body(table["header"], table["types"], settings=LOAD_SETTINGS)
+        self.es.indices.create(index=table["index_name"], body=body)
+        return table["index_name"]
+
+    def create_missing(self, tables, pool):
+        if self.shared is not None:
+            self.shared.assign(tables)
+            self.created = self.shared.created
+            return
+        missing = {}
+        for table in tables:
+            if table["index_name"] not in self.existing:
+                missing.setdefault(table["index_name"], table)
+        for index_name in pool.map(self._create, missing.values()):
+            self.existing.add(index_name)
+            self.created.append(index_name)
+
+    def prepare(self, tables, pool):
+        """Create the batch's indices and embed its vector columns."""
+        self.create_missing(tables, pool)
+        self.embedder.embed_tables(tables)
+        print(f"✅ Created {len(self.created)} indices, embedded {self.embedder.embedded} texts so far.")
+        return tables
+
+    def actions(self, path):
+        # The next batch is prepared (indices + embeddings) while the
+        # current one is being bulk indexed
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="create") as pool, \
+                ThreadPoolExecutor(1, thread_name_prefix="prepare") as prepare_pool:
+            batches = iter_batches(iter_tables(path, load_table_metadata()), self.create_batch_size)
+            batch = next(batches, None)
+            pending = prepare_pool.submit(self.prepare, batch, pool) if batch else None
+            while pending is not None:
+                tables = pending.result()
+                batch = next(batches, None)
+                pending = prepare_pool.submit(self.prepare, batch, pool) if batch else None
+                for table in tables:
+                    if self.shared is not None:
+                        yield from table_actions(table["shared_index"], table["header"], table["rows"],
+                                                 table["types"], table_id=table["id"])
+                    else:
+                        yield from table_actions(table["index_name"], table["header"], table["rows"],
+                                                 table["types"])
+
+    def restore_settings(self):
+        settings = {"index": {"refresh_interval": None, "number_of_replicas": RESTORE_REPLICAS}}
+        for names in iter_batches(self.created, SETTINGS_BATCH_SIZE):
+            self.es.indices.put_settings(index=",".join(names), body=settings)
+        if self.created:
+            self.es.indices.refresh(index=",".join(self.created) if self.shared else "table*")
+        print(f"⚙️ Restored refresh_interval and replicas on {len(self.created)} indices.")
+
+    def load(self, path):
+        success = failed = 0
+        try:
+            for ok, info in helpers.parallel_bulk(
+                self.es, self.actions(path), thread_count=self.workers,
+                chunk_size=self.chunk_size, raise_on_error=False, raise_on_exception=False
+            ):
+                if ok:
+                    success += 1
+                else:
+                    failed += 1
+                    if failed <= 10:
+                        print("❗ Document failed:", info)
+        finally:
+            self.restore_settings()
+        return success, failed
 
 # --- Main upload loop ---
-with open(JSONL_FILE, 'r', encoding='utf-8') as file:
-    for line in file:
-        data = json.loads(line.strip())
-        if 'header' in data and 'id' in data:
-            table_id = f"table{data['id'].replace('-', '_')[1:]}"
-            headers = data["header"]
-            types = data["types"]
-            rows = data["rows"]
-
-            create_index_with_mapping(es, table_id, headers, types)
-            upload_table_to_index(es, table_id, headers, rows, types)
+def main(path=JSONL_FILE, mode=UPLOAD_MODE):
+    wait_for_elasticsearch()
+    if INDEX_LAYOUT != "shared":
+        # Only one-index-per-table needs thousands of shards
+        set_max_shards_per_node()
+
+    # --- Initialize Elasticsearch client ---
+    es = Elasticsearch(ES_HOST)
+
+    start = time.monotonic()
+    if mode == "serial" and INDEX_LAYOUT != "shared":
+        success, failed = 0, 0
+        embedder = TextEmbedder()
+        for data in iter_tables(path, load_table_metadata()):
+            embedder.embed_tables([data])
+            create_index_with_mapping(es, data["index_name"], data["header"], data["types"])
+            uploaded, errors = upload_table_to_index(es, data["index_name"], data["header"], data["rows"],
+                                                     data["types"])
+            success += uploaded
+            failed += errors
+    else:
+        success, failed = ParallelLoader(es).load(path)
+
+    elapsed = time.monotonic() - start
+    print(f"📦 Uploaded {success} docs ({failed} failed) in {elapsed:.1f}s "
+          f"→ {success / elapsed if elapsed else 0:.0f} docs/s")
+
+if __name__ == "__main__":
+    main()